@@ -1,5 +1,25 @@
+import asyncio
+import logging
+
 from mangum import Mangum
 from app.main import app
+from app.database import prewarm_database, ensure_unique_indexes
+
+logger = logging.getLogger(__name__)
+
+# Open the MongoDB connection during the INIT phase so the first request
+# doesn't pay for the handshake. Lifespan stays "off": Mangum runs the
+# lifespan cycle on every invocation, which would close the client each time.
+try:
+    asyncio.get_event_loop().run_until_complete(prewarm_database())
+except Exception as e:
+    logger.warning(f"MongoDB prewarm failed, connecting on first request: {e}")
+
+# Lifespan is off here, so build the unique indexes register_user relies on
+try:
+    asyncio.get_event_loop().run_until_complete(ensure_unique_indexes())
+except Exception as e:
+    logger.error(f"Could not ensure unique indexes: {e}")
 
 # Wrap FastAPI app with Mangum for serverless deployment
 handler = Mangum(app, lifespan="off")
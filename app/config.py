@@ -1,9 +1,10 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
 
 
 class Settings(BaseSettings):
     """Application settings"""
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=True)
 
     # App Configuration
     APP_NAME: str = "CityPulse Live"
@@ -18,6 +19,10 @@ class Settings(BaseSettings):
     # MongoDB
     MONGODB_URL: str
     DATABASE_NAME: str = "citypulse_live"
+    MONGODB_MIN_POOL_SIZE: int = 2
+    MONGODB_MAX_POOL_SIZE: int = 50  # Sized for one uvicorn worker; override lower on serverless
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 3000
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = 2000  # Fail fast when the pool is exhausted
 
     # AWS Cognito Configuration
     AWS_REGION: str = "us-east-2"
@@ -37,6 +42,14 @@ class Settings(BaseSettings):
     # Collectibles
     COLLECTIBLE_DROP_INTERVAL: int = 300  # 5 minutes
 
+    # Location updates
+    LOCATION_UPDATE_MIN_INTERVAL: float = 1.0  # Seconds between processed updates per user
+    LOCATION_BROADCAST_INTERVAL: float = 0.2  # Seconds between batched positions frames
+
+    # WebSockets
+    WS_MAX_CONCURRENT_SENDS: int = 256  # In-flight socket writes across all connections
+    WS_OUTBOX_SIZE: int = 1000  # Queued messages per connection before it is dropped as slow
+
     # Feature Flags
     ENABLE_TRANSCRIPTION: bool = True
 
@@ -44,9 +57,5 @@ class Settings(BaseSettings):
     RATE_LIMIT_MAX_ATTEMPTS: int = 5  # Max failed attempts per minute
     RATE_LIMIT_BLOCK_DURATION: int = 900  # 15 minutes in seconds
 
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
-
 
 settings = Settings()
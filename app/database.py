@@ -1,12 +1,13 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING, DESCENDING
+from pymongo import AsyncMongoClient, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
 from app.config import settings
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Global database client
-client: AsyncIOMotorClient = None
+client: AsyncMongoClient = None
 database = None
 
 
@@ -15,52 +16,119 @@ async def get_database():
     global database
     if database is None:
         global client
-        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        client = AsyncMongoClient(
+            settings.MONGODB_URL,
+            minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+            maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+            serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS
+        )
         database = client[settings.DATABASE_NAME]
         logger.info(f"✅ Connected to MongoDB database: {settings.DATABASE_NAME}")
     return database
 
 
+async def prewarm_database():
+    """Open the client and complete the TLS handshake before the first request"""
+    db = await get_database()
+    await client.admin.command("ping")
+    logger.info("✅ MongoDB connection prewarmed")
+    return db
+
+
 async def close_database():
     """Close database connection"""
     global client
     if client:
-        client.close()
+        await client.close()
         logger.info("✅ MongoDB connection closed")
 
 
+async def ensure_unique_indexes(db=None):
+    """
+    Build the unique indexes request handlers rely on to reject duplicates
+
+    Called at startup (create_index is a no-op for an existing index):
+    register_user has no pre-check and counts on the phone index.
+    """
+    if db is None:
+        db = await get_database()
+
+    # The original phone index was not partial: every Cognito user (no phone
+    # field) indexed as phone: null, so the second one failed with E11000
+    async for index in await db.users.list_indexes():
+        if index["name"] == "phone_1" and "partialFilterExpression" not in index:
+            logger.info("🔧 Replacing non-partial users.phone index")
+            try:
+                await db.users.drop_index("phone_1")
+            except OperationFailure:
+                # Another worker dropped it first
+                pass
+
+    await asyncio.gather(
+        db.users.create_index("phone", unique=True, partialFilterExpression={"phone": {"$type": "string"}}),
+        # sparse: legacy phone-only users have no cognito_sub
+        db.users.create_index("cognito_sub", unique=True, sparse=True),
+        # A collectible can land in a user's inventory only once
+        db.user_collectibles.create_index([("user_id", ASCENDING), ("collectible_id", ASCENDING)], unique=True),
+    )
+    logger.info("✅ Unique indexes ensured")
+
+
 async def init_database():
     """Initialize database with collections and indexes"""
     db = await get_database()
 
     logger.info("🔧 Initializing database indexes...")
 
-    # USERS Collection Indexes
-    await db.users.create_index("phone", unique=True)
-    await db.users.create_index([("current_location", "2dsphere")])
-    logger.info("✅ Users indexes created")
-
-    # EVENTS Collection Indexes
-    await db.events.create_index([("location", "2dsphere")])
-    await db.events.create_index([("status", ASCENDING), ("created_at", DESCENDING)])
-    await db.events.create_index("creator_id")
-    logger.info("✅ Events indexes created")
-
-    # COLLECTIBLES Collection Indexes
-    await db.collectibles.create_index("event_id")
-    await db.collectibles.create_index("claimed_by")
-    await db.collectibles.create_index([("is_active", ASCENDING), ("expires_at", ASCENDING)])
-    logger.info("✅ Collectibles indexes created")
-
-    # USER_COLLECTIBLES Collection Indexes
-    await db.user_collectibles.create_index("user_id")
-    await db.user_collectibles.create_index("collectible_id")
-    await db.user_collectibles.create_index([("user_id", ASCENDING), ("claimed_at", DESCENDING)])
-    logger.info("✅ User collectibles indexes created")
-
-    # TRANSCRIPTIONS Collection Indexes
-    await db.transcriptions.create_index("event_id")
-    await db.transcriptions.create_index("created_at")
-    logger.info("✅ Transcriptions indexes created")
+    await ensure_unique_indexes(db)
+
+    # Indexes are independent, so the server builds them concurrently
+    await asyncio.gather(
+        # USERS Collection Indexes
+        db.users.create_index([("current_location", "2dsphere")]),
+
+        # EVENTS Collection Indexes
+        # location-only index serves /events/nearby without a status filter
+        db.events.create_index([("location", "2dsphere")]),
+        db.events.create_index([("status", ASCENDING), ("location", "2dsphere")]),
+        db.events.create_index([("status", ASCENDING), ("created_at", DESCENDING)]),
+        # Serves "my events" by status; the prefix also serves creator_id lookups
+        db.events.create_index([("creator_id", ASCENDING), ("status", ASCENDING)]),
+
+        # COLLECTIBLES Collection Indexes
+        # Also serves plain event_id lookups through its prefix
+        db.collectibles.create_index(
+            [("event_id", ASCENDING), ("is_active", ASCENDING), ("claimed_by", ASCENDING), ("dropped_at", DESCENDING)],
+            name="active_by_event"
+        ),
+        db.collectibles.create_index("claimed_by"),
+        # Serves expire_old_collectibles; partial, so it only holds live drops
+        # and the once-a-minute sweep never walks inactive history
+        db.collectibles.create_index(
+            [("claimed_by", ASCENDING), ("expires_at", ASCENDING)],
+            partialFilterExpression={"is_active": True},
+            name="live_by_expiry"
+        ),
+        # TTL: unclaimed drops are deleted once expired; claimed ones stay
+        # (successful_claims becomes 1) because inventories $lookup them
+        db.collectibles.create_index(
+            "expires_at",
+            expireAfterSeconds=0,
+            partialFilterExpression={"metadata.successful_claims": 0},
+            name="ttl_expires"
+        ),
+
+        # USER_COLLECTIBLES Collection Indexes
+        db.user_collectibles.create_index("user_id"),
+        db.user_collectibles.create_index("collectible_id"),
+        db.user_collectibles.create_index([("user_id", ASCENDING), ("claimed_at", DESCENDING)]),
+
+        # TRANSCRIPTIONS Collection Indexes
+        db.transcriptions.create_index("event_id"),
+        db.transcriptions.create_index("created_at"),
+        db.transcription_segments.create_index([("transcription_id", ASCENDING), ("start_time", ASCENDING)]),
+    )
+    logger.info("✅ Users, events, collectibles, user collectibles, transcriptions and segments indexes created")
 
     logger.info("🎉 Database initialization complete!")
@@ -1,19 +1,24 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+from functools import lru_cache
 from datetime import datetime
+import asyncio
 import logging
+import orjson
+import time
+from random import random as _rand
 
 from app.config import settings
-from app.database import get_database, close_database
+from app.database import get_database, close_database, ensure_unique_indexes
 from app.routes import users, events, collectibles, transcription
+from app.routes.transcription import close_deepgram_client
+from app.services.daily_service import close_daily_client
 from app.routes import auth  # New auth routes with Cognito
-from app.websockets.manager import ConnectionManager
-from app.services.collectible_service import CollectibleService
+from app.websockets.manager import manager
 from app.middleware.rate_limiter import RateLimitMiddleware, rate_limiter
-from app.middleware.auth import verify_websocket_token, CognitoUser
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from bson import ObjectId
+from app.middleware.auth import verify_websocket_token, CognitoUser, cognito_jwks, close_jwks_client
 
 # Logging configuration
 logging.basicConfig(
@@ -22,11 +27,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# WebSocket Connection Manager
-manager = ConnectionManager()
-
-# Scheduler for background tasks
-scheduler = AsyncIOScheduler()
+# Fallback refresh period for the nearby-events index when change streams are unavailable
+EVENT_INDEX_RELOAD_SECONDS = 30
+
+# Event fields kept in the nearby-events index (and sent in proximity messages)
+NEARBY_EVENT_PROJECTION = {
+    "_id": 1,
+    "creator_id": 1,
+    "title": 1,
+    "category": 1,
+    "location": 1,
+    "status": 1,
+    "room.current_participants": 1
+}
+
+
+async def run_periodically(job, interval: float):
+    """Run a coroutine function every `interval` seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await job()
+        except Exception:
+            logger.exception(f"Background job {job.__name__} failed")
 
 
 # Lifespan context manager
@@ -36,44 +59,40 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Starting CityPulse Live API...")
 
-    # Initialize database
-    await get_database()
+    # Initialize database once; handlers receive it through app.state.db
+    app.state.db = await get_database()
     logger.info("✅ Database connected")
 
-    # Start background tasks
-    scheduler.start()
-    logger.info("✅ Scheduler started")
-
-    # Schedule collectible drops (every 5 minutes)
-    scheduler.add_job(
-        drop_random_collectibles,
-        'interval',
-        seconds=settings.COLLECTIBLE_DROP_INTERVAL,
-        id='collectible_dropper'
-    )
+    # Duplicate phones/claims are rejected by these indexes, not by pre-checks
+    await ensure_unique_indexes(app.state.db)
 
-    # Schedule expired collectibles cleanup (every minute)
-    scheduler.add_job(
-        cleanup_expired_collectibles,
-        'interval',
-        seconds=60,
-        id='collectible_cleaner'
-    )
-
-    # Schedule rate limiter cleanup (every 30 minutes)
-    scheduler.add_job(
-        rate_limiter.cleanup_old_records,
-        'interval',
-        minutes=30,
-        id='rate_limiter_cleaner'
-    )
-    logger.info("Rate limiter cleanup scheduled")
+    # Start background tasks
+    background_tasks = [
+        # Collectible drops (every 5 minutes)
+        asyncio.create_task(run_periodically(drop_random_collectibles, settings.COLLECTIBLE_DROP_INTERVAL)),
+        # Expired collectibles cleanup (every minute)
+        asyncio.create_task(run_periodically(cleanup_expired_collectibles, 60)),
+        # Throttled location updates flush
+        asyncio.create_task(run_periodically(flush_pending_location_updates, settings.LOCATION_UPDATE_MIN_INTERVAL)),
+        # Batched location broadcasts
+        asyncio.create_task(run_periodically(manager.flush_positions, settings.LOCATION_BROADCAST_INTERVAL)),
+        # Rate limiter cleanup (every 30 minutes)
+        asyncio.create_task(run_periodically(rate_limiter.cleanup_old_records, 30 * 60)),
+        # Keep the in-memory nearby-events index in sync with MongoDB
+        asyncio.create_task(sync_event_index()),
+        # Refresh Cognito signing keys ahead of expiry
+        asyncio.create_task(cognito_jwks.run_refresher()),
+    ]
+    logger.info("✅ Background tasks started")
 
     yield
 
     # Shutdown
     logger.info("🛑 Shutting down CityPulse Live API...")
-    scheduler.shutdown()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await asyncio.gather(close_jwks_client(), close_daily_client(), close_deepgram_client())
     await close_database()
     logger.info("✅ Database closed")
 
@@ -83,18 +102,19 @@ app = FastAPI(
     title=settings.APP_NAME,
     version=settings.API_VERSION,
     description="Real-time civic engagement platform for Bogotá - MVP",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
 # CORS Configuration
-# Allow all origins for serverless deployment (Vercel) and local file access
+# Exact-match origins from CORS_ORIGINS (comma-separated)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins (required for Vercel serverless)
-    allow_credentials=False,  # Must be False when using wildcard origins
+    allow_origins=[origin.strip() for origin in settings.CORS_ORIGINS.split(",") if origin.strip()],
+    allow_credentials=False,  # Auth uses Bearer tokens, not cookies
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["*"]
+    expose_headers=["Retry-After", "X-RateLimit-Blocked"]  # Set by the rate limiter
 )
 
 # Add Rate Limiting Middleware for login endpoints
@@ -193,28 +213,33 @@ async def websocket_endpoint(
             # return
 
     await manager.connect(websocket, user_id)
+    db = websocket.app.state.db
     logger.info(f"User {user_id} connected via WebSocket (authenticated: {authenticated_user is not None})")
 
     try:
         while True:
             # Receive message from client
-            data = await websocket.receive_json()
+            data = orjson.loads(await websocket.receive_text())
             message_type = data.get("type")
+            # One clock read per message, shared by the handler's writes and replies
+            now = datetime.now()
 
             if message_type == "location_update":
-                await handle_location_update(user_id, data)
+                # Chatty GPS clients are coalesced to one processed update per interval
+                if manager.throttle_location_update(user_id, data):
+                    await handle_location_update(user_id, data, db, now)
 
             elif message_type == "join_event":
-                await handle_join_event(user_id, data)
+                await handle_join_event(user_id, data, db, now)
 
             elif message_type == "leave_event":
-                await handle_leave_event(user_id, data)
+                await handle_leave_event(user_id, data, db, now)
 
             elif message_type == "chat_message":
-                await handle_chat_message(user_id, data)
+                await handle_chat_message(user_id, data, now)
 
             elif message_type == "claim_collectible":
-                await handle_claim_collectible(user_id, data)
+                await handle_claim_collectible(user_id, data, db, now)
 
             else:
                 logger.warning(f"Unknown message type: {message_type}")
@@ -227,7 +252,7 @@ async def websocket_endpoint(
         await manager.broadcast({
             "type": "user_disconnected",
             "user_id": user_id,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now()
         })
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id}: {e}")
@@ -238,7 +263,15 @@ async def websocket_endpoint(
 # WebSocket Message Handlers
 # ========================================
 
-async def handle_location_update(user_id: str, data: dict):
+@lru_cache(maxsize=4096)
+def _oid(value: str):
+    """Parse an ObjectId string, memoized for ids seen on every message"""
+    from bson import ObjectId
+
+    return ObjectId(value)
+
+
+async def handle_location_update(user_id: str, data: dict, db, now: datetime):
     """Handle real-time location updates with data consistency"""
     coordinates = data.get("coordinates")  # [lng, lat]
     accuracy = data.get("accuracy")
@@ -252,103 +285,85 @@ async def handle_location_update(user_id: str, data: dict):
     try:
         # Validate coordinates
         lng, lat = coordinates
-        if not (-180 <= lng <= 180 and -90 <= lat <= 90):
+        if abs(lng) > 180 or abs(lat) > 90:
             logger.warning(f"Coordinates out of range from {user_id}: {coordinates}")
             return
+        point = (lng, lat)
 
         # Update in-memory location with race condition protection
         location = await manager.update_user_location(
             user_id, 
-            tuple(coordinates),
+            point,
             accuracy=accuracy,
             speed=speed,
-            heading=heading
+            heading=heading,
+            timestamp=now
         )
 
-        # Update user location in database (async, non-blocking)
-        db = await get_database()
-        try:
-            result = await db.users.update_one(
-                {"_id": ObjectId(user_id)},
-                {
-                    "$set": {
-                        "current_location": {
-                            "type": "Point",
-                            "coordinates": coordinates
-                        },
-                        "updated_at": datetime.now()
-                    }
-                }
-            )
-            if result.matched_count == 0:
-                logger.warning(f"User {user_id} not found in database for location update")
-        except Exception as db_error:
-            logger.error(f"Database error updating location for {user_id}: {db_error}")
-            # Continue execution even if DB update fails
-
-        # Broadcast location update to all connected users
-        await manager.broadcast_location_update(user_id, location, exclude_user=False)
-
-        # Find nearby events (within 5km)
-        nearby_events = await db.events.find({
-            "location": {
-                "$near": {
-                    "$geometry": {
-                        "type": "Point",
-                        "coordinates": coordinates
-                    },
-                    "$maxDistance": 5000  # 5km
-                }
-            },
-            "status": "active"
-        }).to_list(20)
+        # Persist location while the broadcast and nearby-events query run
+        persist_task = asyncio.create_task(persist_user_location(db, user_id, coordinates, now))
 
-        # Convert ObjectIds to strings
-        for event in nearby_events:
-            event["_id"] = str(event["_id"])
-            event["creator_id"] = str(event["creator_id"])
+        # Queue location update for the next batched broadcast to all connected users
+        await manager.broadcast_location_update(user_id, location)
 
-        # Send nearby events to user
-        await manager.send_personal_message(user_id, {
-            "type": "nearby_events",
-            "events": nearby_events,
-            "timestamp": datetime.now().isoformat()
-        })
+        # Find nearby events (within 5km) from the in-memory index
+        nearby_events = manager.events_near(point, 5000)
 
-        # Get nearby users
-        nearby_users = await manager.get_nearby_users(tuple(coordinates), radius_km=5.0)
-        
-        # Send nearby users to user (excluding themselves)
-        nearby_users = [u for u in nearby_users if u["user_id"] != user_id]
+        # Get nearby users (excluding themselves)
+        nearby_users = await manager.get_nearby_users(point, radius_km=5.0, exclude_user_id=user_id)
+
+        # Send nearby events and users to user in a single frame
         await manager.send_personal_message(user_id, {
-            "type": "nearby_users",
+            "type": "proximity",
+            "events": nearby_events,
             "users": nearby_users,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now
         })
 
+        await persist_task
+
     except Exception as e:
         logger.error(f"Error handling location update for {user_id}: {e}")
         await manager.send_personal_message(user_id, {
             "type": "error",
             "message": "Failed to update location",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now
         })
 
 
-async def handle_join_event(user_id: str, data: dict):
+async def persist_user_location(db, user_id: str, coordinates: list, now: datetime):
+    """Write the user's latest location to MongoDB, logging (not raising) failures"""
+    try:
+        result = await db.users.update_one(
+            {"_id": _oid(user_id)},
+            {
+                "$set": {
+                    "current_location": {
+                        "type": "Point",
+                        "coordinates": coordinates
+                    },
+                    "updated_at": now
+                }
+            }
+        )
+        if result.matched_count == 0:
+            logger.warning(f"User {user_id} not found in database for location update")
+    except Exception as db_error:
+        logger.error(f"Database error updating location for {user_id}: {db_error}")
+
+
+async def handle_join_event(user_id: str, data: dict, db, now: datetime):
     """Handle user joining an event with race condition protection"""
     event_id = data.get("event_id")
 
-    db = await get_database()
-
     # Update event participants
     await db.events.update_one(
-        {"_id": ObjectId(event_id)},
+        {"_id": _oid(event_id)},
         {
             "$push": {
                 "participants": {
                     "user_id": user_id,
-                    "joined_at": datetime.now(),
+                    "joined_at": now,
                     "is_active": True
                 }
             },
@@ -358,7 +373,7 @@ async def handle_join_event(user_id: str, data: dict):
 
     # Update user stats
     await db.users.update_one(
-        {"_id": ObjectId(user_id)},
+        {"_id": _oid(user_id)},
         {"$inc": {"stats.events_attended": 1}}
     )
 
@@ -370,19 +385,17 @@ async def handle_join_event(user_id: str, data: dict):
         "type": "user_joined",
         "user_id": user_id,
         "event_id": event_id,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now
     })
 
 
-async def handle_leave_event(user_id: str, data: dict):
+async def handle_leave_event(user_id: str, data: dict, db, now: datetime):
     """Handle user leaving an event with race condition protection"""
     event_id = data.get("event_id")
 
-    db = await get_database()
-
     # Update event participants
     await db.events.update_one(
-        {"_id": ObjectId(event_id)},
+        {"_id": _oid(event_id)},
         {
             "$pull": {
                 "participants": {"user_id": user_id}
@@ -399,11 +412,11 @@ async def handle_leave_event(user_id: str, data: dict):
         "type": "user_left",
         "user_id": user_id,
         "event_id": event_id,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now
     })
 
 
-async def handle_chat_message(user_id: str, data: dict):
+async def handle_chat_message(user_id: str, data: dict, now: datetime):
     """Handle chat messages in event"""
     event_id = data.get("event_id")
     message = data.get("message")
@@ -413,15 +426,16 @@ async def handle_chat_message(user_id: str, data: dict):
         "type": "chat_message",
         "user_id": user_id,
         "message": message,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now
     })
 
 
-async def handle_claim_collectible(user_id: str, data: dict):
+async def handle_claim_collectible(user_id: str, data: dict, db, now: datetime):
     """Handle collectible claim attempt"""
+    from app.services.collectible_service import CollectibleService
+
     collectible_id = data.get("collectible_id")
 
-    db = await get_database()
     collectible_service = CollectibleService(db)
 
     # Attempt to claim (race condition handled in service)
@@ -431,7 +445,7 @@ async def handle_claim_collectible(user_id: str, data: dict):
     await manager.send_personal_message(user_id, {
         "type": "claim_result",
         "result": result,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now
     })
 
     # If successful, broadcast to event participants
@@ -443,8 +457,8 @@ async def handle_claim_collectible(user_id: str, data: dict):
                 "type": "collectible_claimed",
                 "collectible_id": collectible_id,
                 "winner_id": user_id,
-                "winner_name": result.get("winner_name", "Otro usuario"),
-                "timestamp": datetime.now().isoformat()
+                "winner_name": result.get("winner_name") or "Otro usuario",
+                "ts_ms": time.time_ns() // 1_000_000
             })
 
 
@@ -454,48 +468,110 @@ async def handle_claim_collectible(user_id: str, data: dict):
 
 async def drop_random_collectibles():
     """Background task to drop collectibles in active events"""
+    from app.services.collectible_service import CollectibleService
+
     logger.info("🎁 Dropping random collectibles...")
 
     db = await get_database()
     collectible_service = CollectibleService(db)
 
     # Find active events with participants
-    active_events = await db.events.find({
-        "status": "active",
-        "room.current_participants": {"$gte": 3}  # At least 3 people
-    }).to_list(100)
-
-    for event in active_events:
-        # Random chance to drop (50%)
-        import random
-        if random.random() < 0.5:
-            # Drop collectible
-            collectible = await collectible_service.drop_random_collectible(
-                str(event["_id"]),
-                event["location"]["coordinates"]
-            )
-
-            # Convert datetime objects to ISO strings for JSON serialization
-            collectible_broadcast = {
-                **collectible,
-                "dropped_at": collectible["dropped_at"].isoformat() if isinstance(collectible.get("dropped_at"), datetime) else collectible.get("dropped_at"),
-                "expires_at": collectible["expires_at"].isoformat() if isinstance(collectible.get("expires_at"), datetime) else collectible.get("expires_at"),
-                "created_at": collectible["created_at"].isoformat() if isinstance(collectible.get("created_at"), datetime) else collectible.get("created_at"),
-            }
+    active_events = await db.events.find(
+        {
+            "status": "active",
+            "room.current_participants": {"$gte": 3}  # At least 3 people
+        },
+        {"_id": 1, "location.coordinates": 1}
+    ).to_list(100)
+
+    # Random chance to drop (50%) per event
+    selected_events = [event for event in active_events if _rand() < 0.5]
+    if not selected_events:
+        return
 
-            # Broadcast to all participants
-            await manager.broadcast_to_event(str(event["_id"]), {
-                "type": "collectible_drop",
-                "collectible": collectible_broadcast,
-                "expires_in": 30,  # seconds
-                "timestamp": datetime.now().isoformat()
-            })
+    # Insert every drop of this round in one round trip
+    collectibles = await collectible_service.drop_random_collectibles(
+        [(str(event["_id"]), event["location"]["coordinates"]) for event in selected_events]
+    )
+
+    async def broadcast_drop(collectible: dict):
+        # Broadcast to all participants (orjson encodes the datetimes)
+        await manager.broadcast_to_event(collectible["event_id"], {
+            "type": "collectible_drop",
+            "collectible": collectible,
+            "expires_in": 30,  # seconds
+            "ts_ms": time.time_ns() // 1_000_000
+        })
+
+        logger.info(f"✅ Dropped {collectible['type']} collectible in event {collectible['event_id']}")
+
+    # Broadcast to all selected events concurrently
+    results = await asyncio.gather(
+        *(broadcast_drop(collectible) for collectible in collectibles),
+        return_exceptions=True
+    )
+
+    for collectible, result in zip(collectibles, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error broadcasting collectible drop in event {collectible['event_id']}: {result}")
+
+
+async def flush_pending_location_updates():
+    """Background task to process the latest location held back by the throttle"""
+    due_updates = manager.pop_due_location_updates()
+    if not due_updates:
+        return
+
+    db = await get_database()
+    now = datetime.now()
+    for user_id, data in due_updates:
+        await handle_location_update(user_id, data, db, now)
+
+
+async def sync_event_index():
+    """
+    Background task mirroring active events into manager.event_index
 
-            logger.info(f"✅ Dropped {collectible['type']} collectible in event {event['_id']}")
+    Loads all active events, then follows a change stream on db.events.
+    Change streams need a replica set; without one the index is reloaded
+    every EVENT_INDEX_RELOAD_SECONDS instead.
+    """
+    db = await get_database()
+
+    # Trim change stream documents to the same fields as the initial load
+    change_pipeline = [{"$project": {
+        "operationType": 1,
+        "documentKey": 1,
+        **{f"fullDocument.{field}": 1 for field in NEARBY_EVENT_PROJECTION}
+    }}]
+
+    async def reload():
+        events = await db.events.find({"status": "active"}, NEARBY_EVENT_PROJECTION).to_list(None)
+        manager.event_index.replace_all(events)
+        logger.info(f"🗺️ Event index loaded with {len(events)} active events")
+
+    while True:
+        try:
+            # Open the stream before loading so no change falls in between
+            async with await db.events.watch(change_pipeline, full_document="updateLookup") as stream:
+                await reload()
+                async for change in stream:
+                    manager.event_index.apply_change(change)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Event change stream unavailable, polling instead: {e}")
+            try:
+                await reload()
+            except Exception as reload_error:
+                logger.error(f"Error reloading event index: {reload_error}")
+            await asyncio.sleep(EVENT_INDEX_RELOAD_SECONDS)
 
 
 async def cleanup_expired_collectibles():
     """Background task to clean up expired collectibles"""
+    from app.services.collectible_service import CollectibleService
+
     db = await get_database()
     collectible_service = CollectibleService(db)
 
@@ -19,6 +19,7 @@ from app.middleware.room_authorization import (
     authorize_room_action,
     check_room_permission,
     get_user_room_role,
+    invalidate_room_role,
     full_room_authorization
 )
 
@@ -42,5 +43,6 @@ __all__ = [
     "authorize_room_action",
     "check_room_permission",
     "get_user_room_role",
+    "invalidate_room_role",
     "full_room_authorization"
 ]
@@ -9,19 +9,25 @@ Security Scenario 1: Delegated Authentication with JWT (Cloud Provider)
 - Target: 100% protected endpoints, validation < 100ms
 """
 
+import re
 import time
+import asyncio
+import hashlib
 import httpx
-from typing import Optional
+import orjson
+from typing import Dict, Optional, Tuple
 from datetime import datetime
 from functools import lru_cache
 
 from fastapi import Depends, HTTPException, status, Request, WebSocket
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError, jwk
-from jose.utils import base64url_decode
-from pydantic import BaseModel
+import jwt
+from jwt import InvalidTokenError, PyJWK
+from jwt.utils import base64url_decode
+from pydantic import BaseModel, ConfigDict
 
 from app.config import settings
+from app.services.ttl_cache import get_cached, remember
 
 import logging
 logger = logging.getLogger(__name__)
@@ -29,9 +35,24 @@ logger = logging.getLogger(__name__)
 # HTTP Bearer security scheme
 security = HTTPBearer()
 
+# Expected issuer and decode options (constant once settings are loaded)
+_ISSUER = f"https://cognito-idp.{settings.AWS_REGION}.amazonaws.com/{settings.COGNITO_USER_POOL_ID}"
+_DECODE_OPTIONS = {
+    "require": ["exp", "iss"],
+    # Cognito access tokens carry client_id instead of aud,
+    # so aud is checked after decoding only when present
+    "verify_aud": False,
+}
+
+# Shared HTTP client for JWKS fetches (keeps the TLS connection to Cognito alive)
+_jwks_client = httpx.AsyncClient(timeout=10.0)
+
 
 class CognitoUser(BaseModel):
     """Authenticated user from Cognito JWT"""
+    # Frozen: instances are shared across requests through the verified-token cache
+    model_config = ConfigDict(frozen=True)
+
     sub: str  # Cognito user ID (unique identifier)
     email: str
     email_verified: bool = False
@@ -52,57 +73,162 @@ class CognitoUser(BaseModel):
         return datetime.utcnow().timestamp() < self.exp
 
 
+def _max_age(cache_control: Optional[str], default: int) -> int:
+    """Parse max-age from a Cache-Control header"""
+    if cache_control:
+        match = re.search(r"max-age=(\d+)", cache_control)
+        if match:
+            return int(match.group(1))
+    return default
+
+
 class CognitoJWKS:
     """Manages Cognito JSON Web Key Set for token validation"""
 
+    DEFAULT_CACHE_DURATION = 3600  # Used when Cognito sends no max-age
+    MIN_REFRESH_INTERVAL = 60
+    STALE_WHILE_ERROR = 600  # Keep serving old keys this long past expiry if Cognito is down
+
     def __init__(self):
         self.jwks: Optional[dict] = None
-        self.jwks_url = (
-            f"https://cognito-idp.{settings.AWS_REGION}.amazonaws.com/"
-            f"{settings.COGNITO_USER_POOL_ID}/.well-known/jwks.json"
-        )
+        self.jwks_url = f"{_ISSUER}/.well-known/jwks.json"
+        # {kid: public key object}, rebuilt whenever the JWKS is fetched
+        self._signing_keys: Dict[str, object] = {}
+        self._etag: Optional[str] = None
         self._last_fetch: float = 0
-        self._cache_duration: int = 3600  # Cache JWKS for 1 hour
-
-    async def get_jwks(self) -> dict:
-        """Fetch and cache JWKS from Cognito"""
-        current_time = time.time()
+        self._cache_duration: int = self.DEFAULT_CACHE_DURATION
+        # Coalesces concurrent refreshes into a single request to Cognito
+        self._refresh_lock = asyncio.Lock()
+
+    async def _fetch(self):
+        """Fetch JWKS from Cognito, revalidating with ETag when we already have keys"""
+        headers = {}
+        if self.jwks and self._etag:
+            headers["If-None-Match"] = self._etag
+
+        response = await _jwks_client.get(self.jwks_url, headers=headers)
+        if response.status_code == 304:
+            logger.debug("JWKS not modified")
+        else:
+            response.raise_for_status()
+            self.jwks = response.json()
+            self._signing_keys = self._build_signing_keys(self.jwks)
+            self._etag = response.headers.get("ETag")
+            logger.info("JWKS fetched successfully from Cognito")
+
+        self._cache_duration = _max_age(response.headers.get("Cache-Control"), self.DEFAULT_CACHE_DURATION)
+        self._last_fetch = time.monotonic()
+
+    async def get_jwks(self, force_refresh: bool = False) -> dict:
+        """Get the cached JWKS, fetching from Cognito if expired or forced"""
+        age = time.monotonic() - self._last_fetch
 
         # Return cached JWKS if still valid
-        if self.jwks and (current_time - self._last_fetch) < self._cache_duration:
+        if self.jwks and not force_refresh and age < self._cache_duration:
             return self.jwks
 
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.jwks_url, timeout=10.0)
-                response.raise_for_status()
-                self.jwks = response.json()
-                self._last_fetch = current_time
-                logger.info("JWKS fetched successfully from Cognito")
+        observed_fetch = self._last_fetch
+        async with self._refresh_lock:
+            # Another caller refreshed the keys while we waited for the lock
+            if self.jwks and self._last_fetch != observed_fetch:
                 return self.jwks
-        except Exception as e:
-            logger.error(f"Failed to fetch JWKS: {e}")
-            # Return cached version if available
-            if self.jwks:
+
+            try:
+                await self._fetch()
                 return self.jwks
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Authentication service unavailable"
-            )
+            except Exception as e:
+                logger.error(f"Failed to fetch JWKS: {e}")
+                # Serve the cached version while it is within the stale-while-error window
+                if self.jwks and age < self._cache_duration + self.STALE_WHILE_ERROR:
+                    return self.jwks
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication service unavailable"
+                )
 
-    async def get_key(self, kid: str) -> Optional[dict]:
-        """Get specific key from JWKS by key ID"""
-        jwks = await self.get_jwks()
+    async def run_refresher(self):
+        """Keep the JWKS fresh in the background so no request pays for a refresh"""
+        while True:
+            try:
+                async with self._refresh_lock:
+                    await self._fetch()
+                interval = self._cache_duration
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Background JWKS refresh failed: {e}")
+                interval = self.MIN_REFRESH_INTERVAL
+            await asyncio.sleep(max(self.MIN_REFRESH_INTERVAL, interval))
+
+    @staticmethod
+    def _build_signing_keys(jwks: dict) -> Dict[str, object]:
+        """Construct a public key object for every key in the set"""
+        signing_keys = {}
         for key in jwks.get("keys", []):
-            if key.get("kid") == kid:
-                return key
-        return None
+            kid = key.get("kid")
+            if not kid:
+                continue
+            try:
+                signing_keys[kid] = PyJWK(key, algorithm="RS256").key
+            except Exception as e:
+                logger.warning(f"Skipping unusable JWKS key {kid}: {e}")
+        return signing_keys
+
+    async def get_signing_key(self, kid: str, force_refresh: bool = False) -> Optional[object]:
+        """Get the public key for a key ID"""
+        await self.get_jwks(force_refresh)
+        return self._signing_keys.get(kid)
 
 
 # Global JWKS manager instance
 cognito_jwks = CognitoJWKS()
 
 
+async def close_jwks_client():
+    """Close the shared JWKS HTTP client (called on app shutdown)"""
+    await _jwks_client.aclose()
+
+# Verified tokens: {blake2b(token): (cache_expiry, CognitoUser)}
+_token_cache: Dict[bytes, Tuple[float, CognitoUser]] = {}
+TOKEN_CACHE_TTL = 60  # seconds, never past the token's own exp
+TOKEN_CACHE_MAX_SIZE = 10000
+
+
+def _cache_verified_user(key: bytes, user: CognitoUser, now: float):
+    """Store a verified user until TOKEN_CACHE_TTL or its exp, whichever comes first"""
+    remember(_token_cache, key, user, min(TOKEN_CACHE_TTL, user.exp - now), TOKEN_CACHE_MAX_SIZE, now=now)
+
+
+def _peek_token(token: str) -> Tuple[Optional[str], Optional[float]]:
+    """
+    Read the key ID and exp claim without verifying the signature.
+
+    Only the header and payload segments are decoded; the signature is
+    left to jwt.decode.
+    """
+    header_segment, _, rest = token.partition(".")
+    payload_segment = rest.partition(".")[0]
+    try:
+        header = orjson.loads(base64url_decode(header_segment))
+        claims = orjson.loads(base64url_decode(payload_segment))
+    except Exception as e:
+        raise InvalidTokenError(f"Invalid token segments: {e}")
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        raise InvalidTokenError("Invalid token: header and payload must be JSON objects")
+
+    exp = claims.get("exp")
+    return header.get("kid"), exp if isinstance(exp, (int, float)) else None
+
+
+def _audience_matches(aud) -> bool:
+    """Check an optional aud claim (string or list) against our Cognito client ID"""
+    if aud is None:
+        return True
+    if isinstance(aud, str):
+        return aud == settings.COGNITO_CLIENT_ID
+    return settings.COGNITO_CLIENT_ID in aud
+
+
 async def verify_jwt_token(token: str) -> CognitoUser:
     """
     Verify and decode a Cognito JWT token.
@@ -114,15 +240,32 @@ async def verify_jwt_token(token: str) -> CognitoUser:
     - Verifies audience/client_id
     - Validates token_use claim
 
+    Verified tokens are cached by hash for up to TOKEN_CACHE_TTL seconds
+    (never past their exp), so repeat requests skip signature verification.
+
     Returns CognitoUser on success, raises HTTPException on failure.
     Validation time target: < 100ms
     """
-    start_time = time.time()
+    # Wall clock: cache expiry is compared against the token's exp claim
+    now = time.time()
 
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = get_cached(_token_cache, cache_key, now=now)
+    if cached is not None:
+        return cached
+
+    start_time = time.monotonic()
     try:
-        # Decode token header to get key ID
-        header = jwt.get_unverified_header(token)
-        kid = header.get("kid")
+        kid, exp = _peek_token(token)
+
+        # Reject expired tokens before paying for RSA verification
+        # (jwt.decode still enforces exp on everything that gets past here)
+        if exp is not None and exp <= now:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token: Signature has expired",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
 
         if not kid:
             raise HTTPException(
@@ -132,39 +275,35 @@ async def verify_jwt_token(token: str) -> CognitoUser:
             )
 
         # Get the signing key from JWKS
-        key_data = await cognito_jwks.get_key(kid)
-        if not key_data:
-            # Key not found, refresh JWKS and retry
-            cognito_jwks._last_fetch = 0  # Force refresh
-            key_data = await cognito_jwks.get_key(kid)
-            if not key_data:
+        public_key = await cognito_jwks.get_signing_key(kid)
+        if not public_key:
+            # Key not found (possibly rotated), refresh JWKS and retry
+            public_key = await cognito_jwks.get_signing_key(kid, force_refresh=True)
+            if not public_key:
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Invalid token: signing key not found",
                     headers={"WWW-Authenticate": "Bearer"}
                 )
 
-        # Construct public key
-        public_key = jwk.construct(key_data)
-
-        # Expected issuer
-        issuer = f"https://cognito-idp.{settings.AWS_REGION}.amazonaws.com/{settings.COGNITO_USER_POOL_ID}"
-
-        # Decode and verify the token
-        payload = jwt.decode(
+        # Decode and verify the token. RSA verification is CPU-bound, so it runs
+        # off the event loop; cache hits above never reach this point
+        payload = await asyncio.to_thread(
+            jwt.decode,
             token,
-            public_key.to_pem().decode('utf-8'),
+            public_key,
             algorithms=["RS256"],
-            audience=settings.COGNITO_CLIENT_ID,
-            issuer=issuer,
-            options={
-                "verify_aud": True,
-                "verify_iss": True,
-                "verify_exp": True,
-                "require_exp": True,
-            }
+            issuer=_ISSUER,
+            options=_DECODE_OPTIONS
         )
 
+        if not _audience_matches(payload.get("aud")):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token: invalid audience",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+
         # Additional validation for token_use
         token_use = payload.get("token_use")
         if token_use not in ["access", "id"]:
@@ -187,15 +326,16 @@ async def verify_jwt_token(token: str) -> CognitoUser:
         )
 
         # Log validation time
-        validation_time = (time.time() - start_time) * 1000
+        validation_time = (time.monotonic() - start_time) * 1000
         logger.debug(f"JWT validation completed in {validation_time:.2f}ms")
 
         if validation_time > 100:
             logger.warning(f"JWT validation exceeded 100ms target: {validation_time:.2f}ms")
 
+        _cache_verified_user(cache_key, user, now)
         return user
 
-    except JWTError as e:
+    except InvalidTokenError as e:
         logger.warning(f"JWT validation failed: {e}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -279,7 +419,7 @@ def get_user_id_from_token(token: str) -> Optional[str]:
     Useful for logging/metrics. Does NOT validate the token.
     """
     try:
-        payload = jwt.get_unverified_claims(token)
+        payload = jwt.decode(token, options={"verify_signature": False})
         return payload.get("sub")
     except Exception:
         return None
@@ -12,11 +12,13 @@ import time
 import asyncio
 from typing import Dict, Optional, Tuple
 from datetime import datetime
-from collections import defaultdict
+from collections import deque
+from itertools import islice
 from dataclasses import dataclass, field
 
 from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from app.config import settings
 
@@ -24,15 +26,22 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class IPRecord:
     """Track failed attempts and blocks for an IP address"""
-    failed_attempts: int = 0
-    first_attempt_time: float = 0
+    failed_attempts: int = 0  # Failures inside the sliding window
+    first_attempt_time: float = 0  # Oldest failure inside the window
+    attempt_times: deque = field(default_factory=deque)
     blocked_until: float = 0
     total_blocks: int = 0  # Track total blocks for this IP
 
 
+LOCK_SHARDS = 64  # Must be a power of two
+
+# Records use the monotonic clock; this converts to wall-clock time for display
+_WALL_CLOCK_OFFSET = time.time() - time.monotonic()
+
+
 class RateLimiter:
     """
     In-memory rate limiter with IP-based tracking.
@@ -44,54 +53,50 @@ class RateLimiter:
     - MAX_ATTEMPTS: Maximum failed attempts in the time window (default: 5)
     - TIME_WINDOW: Time window in seconds (default: 60 seconds = 1 minute)
     - BLOCK_DURATION: How long to block after exceeding limit (default: 900 seconds = 15 minutes)
+    - MAX_RECORDS: Upper bound on tracked IPs, so an address scan cannot exhaust memory
     """
 
     def __init__(
         self,
         max_attempts: int = None,
         time_window: int = 60,
-        block_duration: int = None
+        block_duration: int = None,
+        max_records: int = 100_000
     ):
         self.max_attempts = max_attempts or settings.RATE_LIMIT_MAX_ATTEMPTS
         self.time_window = time_window
         self.block_duration = block_duration or settings.RATE_LIMIT_BLOCK_DURATION
-        self._records: Dict[str, IPRecord] = defaultdict(IPRecord)
-        self._lock = asyncio.Lock()
+        self.max_records = max_records
+        # Insertion-ordered: least recently failing IPs come first
+        self._records: Dict[str, IPRecord] = {}
+        # Per-IP sharded locks so one client's updates never queue behind another's
+        self._locks = [asyncio.Lock() for _ in range(LOCK_SHARDS)]
+
+    def _lock(self, ip: str) -> asyncio.Lock:
+        """Get the lock shard guarding an IP's record"""
+        return self._locks[hash(ip) & (LOCK_SHARDS - 1)]
 
     async def is_blocked(self, ip: str) -> Tuple[bool, Optional[int]]:
         """
         Check if an IP is currently blocked.
 
+        This is a lock-free read: a check racing with record_failed_attempt
+        may let one extra attempt through before the block is seen, which is
+        acceptable for a 5-attempt limiter. Expired windows are reset by
+        record_failed_attempt, so nothing is written here.
+
         Returns:
             Tuple of (is_blocked, seconds_remaining)
         """
-        start_time = time.time()
-
-        async with self._lock:
-            record = self._records.get(ip)
-            if not record:
-                return False, None
-
-            current_time = time.time()
-
-            # Check if currently blocked
-            if record.blocked_until > current_time:
-                remaining = int(record.blocked_until - current_time)
-                latency = (time.time() - start_time) * 1000
-                if latency > 10:
-                    logger.warning(f"Rate limit check exceeded 10ms target: {latency:.2f}ms")
-                return True, remaining
-
-            # Not blocked, but check if we should reset the counter
-            if current_time - record.first_attempt_time > self.time_window:
-                record.failed_attempts = 0
-                record.first_attempt_time = 0
+        record = self._records.get(ip)
+        if record is None:
+            return False, None
 
-        latency = (time.time() - start_time) * 1000
-        if latency > 10:
-            logger.warning(f"Rate limit check exceeded 10ms target: {latency:.2f}ms")
+        current_time = time.monotonic()
+        if record.blocked_until <= current_time:
+            return False, None
 
-        return False, None
+        return True, int(record.blocked_until - current_time)
 
     async def record_failed_attempt(self, ip: str) -> Tuple[bool, Optional[int]]:
         """
@@ -100,23 +105,27 @@ class RateLimiter:
         Returns:
             Tuple of (now_blocked, block_duration_seconds)
         """
-        start_time = time.time()
-
-        async with self._lock:
-            record = self._records[ip]
-            current_time = time.time()
-
-            # Reset counter if time window has passed
-            if current_time - record.first_attempt_time > self.time_window:
-                record.failed_attempts = 0
-                record.first_attempt_time = current_time
-
-            # First attempt in window
-            if record.first_attempt_time == 0:
-                record.first_attempt_time = current_time
-
-            # Increment failed attempts
-            record.failed_attempts += 1
+        current_time = time.monotonic()
+
+        async with self._lock(ip):
+            record = self._records.pop(ip, None)
+            if record is None:
+                if len(self._records) >= self.max_records:
+                    self._make_room(current_time)
+                record = IPRecord(attempt_times=deque(maxlen=self.max_attempts))
+            # (Re)insert at the end to keep the dict in recency order
+            self._records[ip] = record
+
+            # Sliding window: forget failures older than time_window, then
+            # count this one (the deque never holds more than max_attempts)
+            attempts = record.attempt_times
+            window_start = current_time - self.time_window
+            while attempts and attempts[0] <= window_start:
+                attempts.popleft()
+            attempts.append(current_time)
+
+            record.failed_attempts = len(attempts)
+            record.first_attempt_time = attempts[0]
 
             logger.info(
                 f"Failed login attempt {record.failed_attempts}/{self.max_attempts} "
@@ -131,7 +140,7 @@ class RateLimiter:
                 # Log security incident
                 self._log_security_incident(ip, record)
 
-                latency = (time.time() - start_time) * 1000
+                latency = (time.monotonic() - current_time) * 1000
                 logger.info(f"Rate limit block applied in {latency:.2f}ms")
 
                 return True, self.block_duration
@@ -142,58 +151,77 @@ class RateLimiter:
         """
         Record a successful login - resets the failed attempt counter.
         """
-        async with self._lock:
+        async with self._lock(ip):
             if ip in self._records:
                 record = self._records[ip]
+                record.attempt_times.clear()
                 record.failed_attempts = 0
                 record.first_attempt_time = 0
                 # Note: We keep blocked_until intact if currently blocked
 
     async def unblock_ip(self, ip: str):
         """Manually unblock an IP (admin function)"""
-        async with self._lock:
+        async with self._lock(ip):
             if ip in self._records:
                 self._records[ip].blocked_until = 0
                 self._records[ip].failed_attempts = 0
+                self._records[ip].attempt_times.clear()
                 logger.info(f"IP {ip} manually unblocked")
 
     async def get_ip_status(self, ip: str) -> dict:
         """Get current status for an IP (for monitoring/admin)"""
-        async with self._lock:
+        async with self._lock(ip):
             record = self._records.get(ip)
             if not record:
                 return {"ip": ip, "status": "clean", "failed_attempts": 0}
 
-            current_time = time.time()
+            current_time = time.monotonic()
             is_blocked = record.blocked_until > current_time
 
             return {
                 "ip": ip,
                 "status": "blocked" if is_blocked else "monitored",
                 "failed_attempts": record.failed_attempts,
-                "blocked_until": datetime.fromtimestamp(record.blocked_until).isoformat() if is_blocked else None,
+                "blocked_until": datetime.fromtimestamp(record.blocked_until + _WALL_CLOCK_OFFSET).isoformat() if is_blocked else None,
                 "remaining_seconds": int(record.blocked_until - current_time) if is_blocked else 0,
                 "total_blocks": record.total_blocks
             }
 
     async def cleanup_old_records(self):
         """Remove old records to prevent memory bloat"""
-        async with self._lock:
-            current_time = time.time()
-            cleanup_threshold = current_time - (self.block_duration * 2)
-
-            ips_to_remove = []
-            for ip, record in self._records.items():
-                # Remove if not blocked and no recent activity
-                if (record.blocked_until < current_time and
-                    record.first_attempt_time < cleanup_threshold):
-                    ips_to_remove.append(ip)
-
-            for ip in ips_to_remove:
-                del self._records[ip]
-
-            if ips_to_remove:
-                logger.info(f"Cleaned up {len(ips_to_remove)} old rate limit records")
+        removed = self._remove_stale(time.monotonic())
+        if removed:
+            logger.info(f"Cleaned up {removed} old rate limit records")
+
+    def _make_room(self, current_time: float):
+        """Free space for a new record once max_records is reached"""
+        self._remove_stale(current_time)
+        if len(self._records) < self.max_records:
+            return
+
+        # Still full of live records: drop the least recent tenth in one pass
+        # so a flood of new IPs does not rescan the whole dict on every insert
+        evict = max(1, self.max_records // 10)
+        for ip in list(islice(self._records, evict)):
+            del self._records[ip]
+        logger.warning(f"Rate limit records at capacity, evicted {evict} oldest entries")
+
+    def _remove_stale(self, current_time: float) -> int:
+        """Remove records that are not blocked and have no recent activity"""
+        # Runs without awaiting, so the scan is atomic with respect to other coroutines
+        cleanup_threshold = current_time - (self.block_duration * 2)
+
+        ips_to_remove = []
+        for ip, record in self._records.items():
+            # Remove if not blocked and no recent activity
+            if (record.blocked_until < current_time and
+                record.first_attempt_time < cleanup_threshold):
+                ips_to_remove.append(ip)
+
+        for ip in ips_to_remove:
+            del self._records[ip]
+
+        return len(ips_to_remove)
 
     def _log_security_incident(self, ip: str, record: IPRecord):
         """Log security incident for audit trail"""
@@ -270,8 +298,10 @@ def get_client_ip(request: Request) -> str:
     # Check X-Forwarded-For (common for load balancers)
     forwarded_for = request.headers.get("X-Forwarded-For")
     if forwarded_for:
-        # Take the first IP (original client)
-        return forwarded_for.split(",")[0].strip()
+        # Take the first IP (original client) without splitting the whole chain
+        client_ip = forwarded_for.partition(",")[0].strip()
+        if client_ip:
+            return client_ip
 
     # Check X-Real-IP
     real_ip = request.headers.get("X-Real-IP")
@@ -282,35 +312,40 @@ def get_client_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+class RateLimitMiddleware:
     """
     Middleware to apply rate limiting to specific endpoints.
 
     This middleware can be configured to only apply to certain paths.
+    Implemented as pure ASGI (not BaseHTTPMiddleware) so requests to
+    unprotected paths pass straight through without a Request object
+    or an extra task group.
     """
 
     def __init__(
         self,
-        app,
+        app: ASGIApp,
         protected_paths: list = None,
         limiter: RateLimiter = None
     ):
-        super().__init__(app)
+        self.app = app
         self.protected_paths = protected_paths or ["/api/users/login", "/api/auth/login"]
+        # str.startswith accepts a tuple and checks every prefix in C
+        self._protected_prefixes = tuple(self.protected_paths)
         self.limiter = limiter or rate_limiter
 
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
         # Check if this path needs rate limiting
-        if not any(request.url.path.startswith(path) for path in self.protected_paths):
-            return await call_next(request)
+        if scope["type"] != "http" or not scope["path"].startswith(self._protected_prefixes):
+            await self.app(scope, receive, send)
+            return
 
-        ip = get_client_ip(request)
+        ip = get_client_ip(Request(scope))
 
         # Check if blocked
         is_blocked, remaining = await self.limiter.is_blocked(ip)
         if is_blocked:
-            from starlette.responses import JSONResponse
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=429,
                 content={
                     "error": "Too many failed login attempts",
@@ -322,5 +357,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
                     "X-RateLimit-Blocked": "true"
                 }
             )
+            await response(scope, receive, send)
+            return
 
-        return await call_next(request)
+        await self.app(scope, receive, send)
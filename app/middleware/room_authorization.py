@@ -9,14 +9,16 @@ Security Scenario 2: Authorization for Video Room Access
 """
 
 import time
-from typing import Optional, List
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
+from types import MappingProxyType
 from datetime import datetime
 
 from fastapi import HTTPException, status, Depends
 from bson import ObjectId
 
 from app.middleware.auth import CognitoUser, get_current_user
+from app.services.ttl_cache import get_cached, remember
 from app.database import get_database
 
 import logging
@@ -42,42 +44,101 @@ class RoomPermission(str, Enum):
     DROP_COLLECTIBLES = "drop_collectibles"
 
 
-# Permission matrix: role -> list of permissions
-ROLE_PERMISSIONS = {
-    RoomRole.CREATOR: [
+# Permission matrix: role -> set of permissions (read-only)
+ROLE_PERMISSIONS = MappingProxyType({
+    RoomRole.CREATOR: frozenset({
         RoomPermission.JOIN,
         RoomPermission.SPEAK,
         RoomPermission.SHARE_SCREEN,
         RoomPermission.MODERATE,
         RoomPermission.END_EVENT,
         RoomPermission.DROP_COLLECTIBLES,
-    ],
-    RoomRole.MODERATOR: [
+    }),
+    RoomRole.MODERATOR: frozenset({
         RoomPermission.JOIN,
         RoomPermission.SPEAK,
         RoomPermission.SHARE_SCREEN,
         RoomPermission.MODERATE,
-    ],
-    RoomRole.PARTICIPANT: [
+    }),
+    RoomRole.PARTICIPANT: frozenset({
         RoomPermission.JOIN,
         RoomPermission.SPEAK,
         RoomPermission.SHARE_SCREEN,
-    ],
-    RoomRole.VIEWER: [
+    }),
+    RoomRole.VIEWER: frozenset({
         RoomPermission.JOIN,
-    ],
-    RoomRole.BANNED: [],  # No permissions
+    }),
+    RoomRole.BANNED: frozenset(),  # No permissions
+})
+
+# Membership lists checked for a role decision: {flag: event field}
+ROOM_MEMBERSHIP_FIELDS = {
+    "is_banned": "banned_users",
+    "is_moderator": "moderators",
+    "is_invited": "invited_users",
 }
 
 
+def _room_access_projection(user_id: str) -> dict:
+    """
+    Projection that evaluates list membership inside MongoDB, so only
+    booleans come back instead of the full moderator/ban/invite lists
+    """
+    projection = {"creator_id": 1, "is_private": 1}
+    for flag, field in ROOM_MEMBERSHIP_FIELDS.items():
+        projection[flag] = {"$in": [user_id, {"$ifNull": [f"${field}", []]}]}
+    return projection
+
+
+def _room_access_from_event(event: dict, user_id: str) -> dict:
+    """Same shape as _room_access_projection, computed from a loaded event"""
+    access = {"creator_id": event.get("creator_id"), "is_private": event.get("is_private", False)}
+    for flag, field in ROOM_MEMBERSHIP_FIELDS.items():
+        access[flag] = user_id in event.get(field, [])
+    return access
+
+
+# Role decisions from the database: {(user_id, event_id): (expiry, role)}
+_role_cache: Dict[Tuple[str, str], Tuple[float, Optional[RoomRole]]] = {}
+ROLE_CACHE_TTL = 30  # seconds
+ROLE_CACHE_MAX_SIZE = 50000
+# A cached role can be None (no access), so misses need their own marker
+_NOT_CACHED = object()
+
+
+def _remember_role(cache_key: Optional[Tuple[str, str]], role: Optional[RoomRole]) -> Optional[RoomRole]:
+    """Cache a role decision (when it came from the database) and return it"""
+    if cache_key is not None:
+        remember(_role_cache, cache_key, role, ROLE_CACHE_TTL, ROLE_CACHE_MAX_SIZE)
+    return role
+
+
+def invalidate_room_role(event_id: str, user_id: Optional[str] = None):
+    """
+    Drop cached role decisions after a ban/unban/promote/invite.
+
+    Invalidates a single user's decision, or every user's when user_id is None.
+    """
+    if user_id is not None:
+        _role_cache.pop((user_id, event_id), None)
+        return
+    for key in [k for k in _role_cache if k[1] == event_id]:
+        del _role_cache[key]
+
+
 async def get_user_room_role(
     user_id: str,
     event_id: str,
-    db=None
+    db=None,
+    event: Optional[dict] = None
 ) -> Optional[RoomRole]:
     """
     Get user's role in a specific event/room.
 
+    Pass `event` when the caller has already loaded the event document
+    to skip the database lookup. Otherwise the decision is cached per
+    (user_id, event_id) for ROLE_CACHE_TTL seconds.
+
     Checks:
     1. If user is the creator -> CREATOR role
     2. If user is in moderators list -> MODERATOR role
@@ -89,54 +150,60 @@ async def get_user_room_role(
     """
     start_time = time.time()
 
-    if db is None:
-        db = await get_database()
+    cache_key = None
+    if event is None:
+        cache_key = (user_id, event_id)
+        cached = get_cached(_role_cache, cache_key, default=_NOT_CACHED)
+        if cached is not _NOT_CACHED:
+            return cached
 
     try:
-        event = await db.events.find_one({"_id": ObjectId(event_id)})
+        if event is None:
+            if db is None:
+                db = await get_database()
+            access = await db.events.find_one({"_id": ObjectId(event_id)}, _room_access_projection(user_id))
+        else:
+            access = _room_access_from_event(event, user_id)
 
-        if not event:
+        if not access:
             logger.warning(f"Event {event_id} not found for authorization check")
-            return None
+            return _remember_role(cache_key, None)
 
         # Check if user is creator
-        if str(event.get("creator_id")) == user_id:
+        if str(access.get("creator_id")) == user_id:
             role = RoomRole.CREATOR
             _log_authorization_time(start_time, user_id, event_id, role)
-            return role
+            return _remember_role(cache_key, role)
 
         # Check if user is banned
-        banned_users = event.get("banned_users", [])
-        if user_id in banned_users:
+        if access["is_banned"]:
             logger.warning(f"Banned user {user_id} attempted to access event {event_id}")
             role = RoomRole.BANNED
             _log_authorization_time(start_time, user_id, event_id, role)
-            return role
+            return _remember_role(cache_key, role)
 
         # Check if user is moderator
-        moderators = event.get("moderators", [])
-        if user_id in moderators:
+        if access["is_moderator"]:
             role = RoomRole.MODERATOR
             _log_authorization_time(start_time, user_id, event_id, role)
-            return role
+            return _remember_role(cache_key, role)
 
         # Check event access type
-        is_private = event.get("is_private", False)
+        is_private = access.get("is_private", False)
 
         if is_private:
             # Check invitation list for private events
-            invited_users = event.get("invited_users", [])
-            if user_id in invited_users:
+            if access["is_invited"]:
                 role = RoomRole.PARTICIPANT
                 _log_authorization_time(start_time, user_id, event_id, role)
-                return role
+                return _remember_role(cache_key, role)
             # Not invited to private event
-            return None
+            return _remember_role(cache_key, None)
         else:
             # Public event - anyone can join as participant
             role = RoomRole.PARTICIPANT
             _log_authorization_time(start_time, user_id, event_id, role)
-            return role
+            return _remember_role(cache_key, role)
 
     except Exception as e:
         logger.error(f"Error checking room authorization: {e}")
@@ -159,19 +226,20 @@ async def check_room_permission(
     user_id: str,
     event_id: str,
     permission: RoomPermission,
-    db=None
+    db=None,
+    event: Optional[dict] = None
 ) -> bool:
     """
     Check if user has specific permission in a room.
 
     Returns True if permitted, False otherwise.
     """
-    role = await get_user_room_role(user_id, event_id, db)
+    role = await get_user_room_role(user_id, event_id, db, event)
 
     if role is None:
         return False
 
-    allowed_permissions = ROLE_PERMISSIONS.get(role, [])
+    allowed_permissions = ROLE_PERMISSIONS.get(role, frozenset())
     return permission in allowed_permissions
 
 
@@ -215,7 +283,7 @@ async def authorize_room_join(
             detail="You have been banned from this event"
         )
 
-    if RoomPermission.JOIN not in ROLE_PERMISSIONS.get(role, []):
+    if RoomPermission.JOIN not in ROLE_PERMISSIONS.get(role, frozenset()):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Your role does not permit joining this room"
@@ -233,7 +301,8 @@ async def authorize_room_join(
 async def authorize_room_action(
     event_id: str,
     permission: RoomPermission,
-    user: CognitoUser
+    user: CognitoUser,
+    event: Optional[dict] = None
 ) -> bool:
     """
     Check if user can perform specific action in room.
@@ -244,7 +313,7 @@ async def authorize_room_action(
                 raise HTTPException(403, "Not authorized to end this event")
             ...
     """
-    return await check_room_permission(user.user_id, event_id, permission)
+    return await check_room_permission(user.user_id, event_id, permission, event=event)
 
 
 class RoomAuthorizationResult:
@@ -291,7 +360,7 @@ async def full_room_authorization(
             reason="User is banned from this event"
         )
 
-    permissions = ROLE_PERMISSIONS.get(role, [])
+    permissions = list(ROLE_PERMISSIONS.get(role, frozenset()))
 
     decision_time = (time.time() - start_time) * 1000
     if decision_time > 150:
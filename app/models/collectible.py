@@ -1,7 +1,8 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List, Union
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, List
 from datetime import datetime
-from bson import ObjectId
+
+from app.models.common import ObjectIdStr
 
 
 class GeoLocation(BaseModel):
@@ -19,38 +20,32 @@ class CollectibleMetadata(BaseModel):
 
 class Collectible(BaseModel):
     """Collectible model"""
-    id: Optional[str] = Field(alias="_id", default=None)
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
     name: str
     type: str = Field(..., description="common, rare, epic, legendary")
     rarity_score: int = Field(..., ge=1, le=100)
     image_url: Optional[str] = None
     description: str
     event_id: str
-    dropped_at: datetime = Field(default_factory=datetime.now)
+    dropped_at: datetime = Field(default_factory=datetime.utcnow)
     expires_at: datetime
     claimed_by: Optional[str] = None
     claimed_at: Optional[datetime] = None
     drop_location: GeoLocation
     metadata: CollectibleMetadata = Field(default_factory=CollectibleMetadata)
     is_active: bool = True
-    created_at: datetime = Field(default_factory=datetime.now)
-
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+    created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 class UserCollectible(BaseModel):
     """User collectible inventory"""
-    id: Optional[str] = Field(alias="_id", default=None)
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
     user_id: str
-    collectible_id: Union[str, ObjectId]  # Accept both string and ObjectId
-    claimed_at: datetime = Field(default_factory=datetime.now)
+    collectible_id: ObjectIdStr  # Accepts both string and ObjectId
+    claimed_at: datetime = Field(default_factory=datetime.utcnow)
     claim_order: int = Field(..., description="Position in claim race (1st, 2nd, etc)")
     event_id: str
-
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True  # Allow ObjectId type
-        json_encoders = {ObjectId: str}
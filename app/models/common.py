@@ -0,0 +1,17 @@
+from typing import Annotated, Any
+
+from bson import ObjectId
+from pydantic import BeforeValidator
+
+
+def _validate_object_id(value: Any) -> str:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return value
+    raise ValueError("Invalid ObjectId")
+
+
+# ObjectId as a plain string field: accepts an ObjectId straight from MongoDB
+# or its hex string, so no arbitrary-type schema is needed
+ObjectIdStr = Annotated[str, BeforeValidator(_validate_object_id)]
@@ -1,7 +1,8 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List
 from datetime import datetime
-from bson import ObjectId
+
+from app.models.common import ObjectIdStr
 
 
 class GeoLocation(BaseModel):
@@ -37,26 +38,23 @@ class EventMetadata(BaseModel):
 
 class Event(BaseModel):
     """Event model"""
-    id: Optional[str] = Field(alias="_id", default=None)
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
     title: str
     description: str
     category: str = Field(..., description="cultura, emergencia, entretenimiento")
-    creator_id: str
+    creator_id: ObjectIdStr
     location: GeoLocation
     status: str = Field(default="active", description="active, ended, cancelled")
     room: RoomInfo = Field(default_factory=RoomInfo)
     participants: List[Participant] = Field(default_factory=list)
     collectibles_dropped: List[str] = Field(default_factory=list)
     metadata: EventMetadata = Field(default_factory=EventMetadata)
-    starts_at: datetime = Field(default_factory=datetime.now)
+    starts_at: datetime = Field(default_factory=datetime.utcnow)
     ends_at: Optional[datetime] = None
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
-
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 class EventCreate(BaseModel):
@@ -1,7 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 from datetime import datetime
 
+from app.models.common import ObjectIdStr
+
 
 class TranscriptSegment(BaseModel):
     """Individual transcript segment"""
@@ -16,14 +18,12 @@ class TranscriptSegment(BaseModel):
 
 class Transcription(BaseModel):
     """Event transcription model"""
-    id: Optional[str] = Field(alias="_id", default=None)
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
     event_id: str
     room_name: str
     segments: List[TranscriptSegment] = Field(default_factory=list)
     full_transcript: str = ""
     languages_detected: List[str] = Field(default_factory=lambda: ["es"])
-    created_at: datetime = Field(default_factory=datetime.now)
-
-    class Config:
-        populate_by_name = True
-        json_encoders = {datetime: lambda v: v.isoformat()}
+    created_at: datetime = Field(default_factory=datetime.utcnow)
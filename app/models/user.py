@@ -1,19 +1,8 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List
 from datetime import datetime
-from bson import ObjectId
 
-
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
-
-    @classmethod
-    def validate(cls, v):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid ObjectId")
-        return ObjectId(v)
+from app.models.common import ObjectIdStr
 
 
 class GeoLocation(BaseModel):
@@ -32,18 +21,15 @@ class UserStats(BaseModel):
 
 class User(BaseModel):
     """User model - MVP simplified (phone + name only)"""
-    id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
     phone: str = Field(..., description="Phone number (unique identifier)")
     name: str = Field(..., description="User display name")
     stats: UserStats = Field(default_factory=UserStats)
     current_location: Optional[GeoLocation] = None
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
-
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 class UserCreate(BaseModel):
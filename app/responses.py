@@ -0,0 +1,17 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+class MongoJSONResponse(ORJSONResponse):
+    """
+    ORJSONResponse that also encodes raw MongoDB documents.
+
+    orjson handles datetimes natively; anything else it does not know
+    (ObjectId) is encoded with str() in the same native pass, so routes
+    can return documents without walking them first.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
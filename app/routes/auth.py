@@ -8,16 +8,20 @@ Handles:
 - User profile sync with MongoDB
 """
 
+import asyncio
 import boto3
+from botocore.config import Config
 from datetime import datetime
 from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Depends, Request, status
 from pydantic import BaseModel, EmailStr, Field
 from botocore.exceptions import ClientError
+from pymongo import ReturnDocument
 
 from app.config import settings
 from app.database import get_database
+from app.middleware.auth import verify_jwt_token
 from app.middleware.rate_limiter import rate_limit_check, rate_limiter, get_client_ip
 
 import logging
@@ -25,10 +29,15 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Initialize Cognito client
+# Initialize Cognito client. boto3 is blocking, so every call goes through
+# asyncio.to_thread; the client is thread-safe and shares one connection pool
 cognito_client = boto3.client(
     'cognito-idp',
-    region_name=settings.AWS_REGION
+    region_name=settings.AWS_REGION,
+    config=Config(
+        max_pool_connections=50,
+        retries={'max_attempts': 2, 'mode': 'adaptive'}
+    )
 )
 
 
@@ -61,6 +70,15 @@ class RefreshTokenRequest(BaseModel):
     refresh_token: str
 
 
+class UserSummary(BaseModel):
+    """User profile returned on login"""
+    id: str
+    cognito_sub: str
+    email: str
+    name: str
+    stats: dict
+
+
 class AuthResponse(BaseModel):
     """Authentication response with tokens"""
     access_token: str
@@ -68,7 +86,7 @@ class AuthResponse(BaseModel):
     refresh_token: str
     expires_in: int
     token_type: str = "Bearer"
-    user: dict
+    user: UserSummary
 
 
 class ForgotPasswordRequest(BaseModel):
@@ -87,6 +105,26 @@ class ResetPasswordRequest(BaseModel):
 # Authentication Endpoints
 # ========================================
 
+def _new_user_doc(attributes: dict, email: str) -> dict:
+    """MongoDB profile for a Cognito user seen for the first time"""
+    now = datetime.utcnow()
+    return {
+        "cognito_sub": attributes.get('sub'),
+        "email": email,
+        "name": attributes.get('name', ''),
+        "phone_number": attributes.get('phone_number'),
+        "stats": {
+            "events_created": 0,
+            "events_attended": 0,
+            "collectibles_count": 0,
+            "total_video_minutes": 0
+        },
+        "current_location": None,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
 @router.post("/register", status_code=status.HTTP_201_CREATED)
 async def register(request_data: RegisterRequest):
     """
@@ -112,7 +150,8 @@ async def register(request_data: RegisterRequest):
             })
 
         # Create user in Cognito
-        response = cognito_client.sign_up(
+        response = await asyncio.to_thread(
+            cognito_client.sign_up,
             ClientId=settings.COGNITO_CLIENT_ID,
             Username=request_data.email,
             Password=request_data.password,
@@ -160,14 +199,16 @@ async def confirm_registration(request_data: ConfirmRegistrationRequest):
     """
     try:
         # Confirm the user in Cognito
-        cognito_client.confirm_sign_up(
+        await asyncio.to_thread(
+            cognito_client.confirm_sign_up,
             ClientId=settings.COGNITO_CLIENT_ID,
             Username=request_data.email,
             ConfirmationCode=request_data.confirmation_code
         )
 
         # Get user info from Cognito
-        user_info = cognito_client.admin_get_user(
+        user_info = await asyncio.to_thread(
+            cognito_client.admin_get_user,
             UserPoolId=settings.COGNITO_USER_POOL_ID,
             Username=request_data.email
         )
@@ -175,34 +216,21 @@ async def confirm_registration(request_data: ConfirmRegistrationRequest):
         # Extract attributes
         attributes = {attr['Name']: attr['Value'] for attr in user_info['UserAttributes']}
 
-        # Create user in MongoDB
+        # Create user in MongoDB unless one exists (by cognito_sub or email),
+        # in a single upsert
         db = await get_database()
-        user_doc = {
-            "cognito_sub": attributes.get('sub'),
-            "email": request_data.email,
-            "name": attributes.get('name', ''),
-            "phone_number": attributes.get('phone_number'),
-            "stats": {
-                "events_created": 0,
-                "events_attended": 0,
-                "collectibles_count": 0,
-                "total_video_minutes": 0
+        result = await db.users.update_one(
+            {
+                "$or": [
+                    {"cognito_sub": attributes.get('sub')},
+                    {"email": request_data.email}
+                ]
             },
-            "current_location": None,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-
-        # Check if user already exists (by cognito_sub or email)
-        existing = await db.users.find_one({
-            "$or": [
-                {"cognito_sub": attributes.get('sub')},
-                {"email": request_data.email}
-            ]
-        })
+            {"$setOnInsert": _new_user_doc(attributes, request_data.email)},
+            upsert=True
+        )
 
-        if not existing:
-            await db.users.insert_one(user_doc)
+        if result.upserted_id is not None:
             logger.info(f"User profile created in MongoDB: {request_data.email}")
 
         return {
@@ -237,7 +265,8 @@ async def confirm_registration(request_data: ConfirmRegistrationRequest):
 async def resend_confirmation_code(email: EmailStr):
     """Resend email verification code"""
     try:
-        cognito_client.resend_confirmation_code(
+        await asyncio.to_thread(
+            cognito_client.resend_confirmation_code,
             ClientId=settings.COGNITO_CLIENT_ID,
             Username=email
         )
@@ -275,7 +304,8 @@ async def login(
 
     try:
         # Authenticate with Cognito
-        response = cognito_client.initiate_auth(
+        response = await asyncio.to_thread(
+            cognito_client.initiate_auth,
             ClientId=settings.COGNITO_CLIENT_ID,
             AuthFlow='USER_PASSWORD_AUTH',
             AuthParameters={
@@ -289,52 +319,41 @@ async def login(
 
         auth_result = response['AuthenticationResult']
 
-        # Get user info from Cognito
-        user_info = cognito_client.get_user(
-            AccessToken=auth_result['AccessToken']
-        )
-
-        # Extract user attributes
-        attributes = {attr['Name']: attr['Value'] for attr in user_info['UserAttributes']}
+        # User attributes come from the ID token, verified locally against
+        # the cached JWKS instead of a get_user round trip to Cognito
+        id_claims = await verify_jwt_token(auth_result['IdToken'])
+        attributes = {
+            'sub': id_claims.sub,
+            'name': id_claims.name or '',
+            'phone_number': id_claims.phone_number
+        }
 
-        # Get or create user in MongoDB
+        # Get or create user in MongoDB in one round trip
         db = await get_database()
-        mongo_user = await db.users.find_one({"cognito_sub": attributes.get('sub')})
-
-        if not mongo_user:
-            # Create user if doesn't exist
-            user_doc = {
-                "cognito_sub": attributes.get('sub'),
-                "email": request_data.email,
-                "name": attributes.get('name', ''),
-                "phone_number": attributes.get('phone_number'),
-                "stats": {
-                    "events_created": 0,
-                    "events_attended": 0,
-                    "collectibles_count": 0,
-                    "total_video_minutes": 0
-                },
-                "current_location": None,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-            result = await db.users.insert_one(user_doc)
-            mongo_user = await db.users.find_one({"_id": result.inserted_id})
+        mongo_user = await db.users.find_one_and_update(
+            {"cognito_sub": attributes.get('sub')},
+            {"$setOnInsert": _new_user_doc(attributes, request_data.email)},
+            projection={"stats": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
 
         logger.info(f"User logged in: {request_data.email} from IP: {ip}")
 
-        return AuthResponse(
+        # Every field comes from Cognito or our own database, so skip
+        # validation here; FastAPI still checks it against response_model
+        return AuthResponse.model_construct(
             access_token=auth_result['AccessToken'],
             id_token=auth_result['IdToken'],
             refresh_token=auth_result['RefreshToken'],
             expires_in=auth_result['ExpiresIn'],
-            user={
-                "id": str(mongo_user['_id']),
-                "cognito_sub": attributes.get('sub'),
-                "email": request_data.email,
-                "name": attributes.get('name', ''),
-                "stats": mongo_user.get('stats', {})
-            }
+            user=UserSummary.model_construct(
+                id=str(mongo_user['_id']),
+                cognito_sub=attributes.get('sub'),
+                email=request_data.email,
+                name=attributes.get('name', ''),
+                stats=mongo_user.get('stats', {})
+            )
         )
 
     except ClientError as e:
@@ -386,7 +405,8 @@ async def refresh_token(request_data: RefreshTokenRequest):
     Use when access token expires (after 24h).
     """
     try:
-        response = cognito_client.initiate_auth(
+        response = await asyncio.to_thread(
+            cognito_client.initiate_auth,
             ClientId=settings.COGNITO_CLIENT_ID,
             AuthFlow='REFRESH_TOKEN_AUTH',
             AuthParameters={
@@ -426,7 +446,8 @@ async def forgot_password(request_data: ForgotPasswordRequest):
     Sends reset code to user's email.
     """
     try:
-        cognito_client.forgot_password(
+        await asyncio.to_thread(
+            cognito_client.forgot_password,
             ClientId=settings.COGNITO_CLIENT_ID,
             Username=request_data.email
         )
@@ -454,7 +475,8 @@ async def reset_password(request_data: ResetPasswordRequest):
     Reset password with confirmation code.
     """
     try:
-        cognito_client.confirm_forgot_password(
+        await asyncio.to_thread(
+            cognito_client.confirm_forgot_password,
             ClientId=settings.COGNITO_CLIENT_ID,
             Username=request_data.email,
             ConfirmationCode=request_data.confirmation_code,
@@ -1,30 +1,38 @@
-from fastapi import APIRouter, HTTPException
-from bson import ObjectId
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+import orjson
+import time
 
 from app.database import get_database
+from app.responses import MongoJSONResponse
 from app.services.collectible_service import CollectibleService
+from app.websockets.manager import manager
 
-router = APIRouter()
+router = APIRouter(default_response_class=MongoJSONResponse)
 
+# Fields the client renders for an active drop
+ACTIVE_COLLECTIBLE_PROJECTION = {
+    "name": 1,
+    "type": 1,
+    "rarity_score": 1,
+    "image_url": 1,
+    "description": 1,
+    "event_id": 1,
+    "drop_location": 1,
+    "dropped_at": 1,
+    "expires_at": 1,
+}
 
-def fix_objectids(obj):
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    if isinstance(obj, list):
-        return [fix_objectids(i) for i in obj]
-    if isinstance(obj, dict):
-        return {k: fix_objectids(v) for k, v in obj.items()}
-    return obj
 
 @router.post("/claim", response_model=dict)
-async def claim_collectible(collectible_id: str, user_id: str):
+async def claim_collectible(collectible_id: str, user_id: str, background_tasks: BackgroundTasks):
     """
     Attempt to claim a collectible (handles race condition)
-    """
-    from app.websockets.manager import ConnectionManager
-    from app.main import manager
-    from datetime import datetime
 
+    The claim is settled in the database before returning; the fanout to
+    event participants runs after the response is sent.
+    """
     db = await get_database()
     collectible_service = CollectibleService(db)
     result = await collectible_service.claim_collectible(collectible_id, user_id)
@@ -33,49 +41,58 @@ async def claim_collectible(collectible_id: str, user_id: str):
     if result.get("success"):
         event_id = result.get("collectible", {}).get("event_id")
         if event_id:
-            # Get user name for notification
-            user = await db.users.find_one({"_id": ObjectId(user_id)})
-            winner_name = user.get("name", "Otro usuario") if user else "Otro usuario"
-
-            await manager.broadcast_to_event(event_id, {
+            background_tasks.add_task(manager.broadcast_to_event, event_id, {
                 "type": "collectible_claimed",
                 "collectible_id": collectible_id,
                 "winner_id": user_id,
-                "winner_name": winner_name,
-                "timestamp": datetime.now().isoformat()
+                "winner_name": result.get("winner_name") or "Otro usuario",
+                "ts_ms": time.time_ns() // 1_000_000
             })
 
-    return fix_objectids(result)
+    # ObjectIds in the claim result are encoded by orjson in one pass
+    return MongoJSONResponse(result)
 
 
 @router.get("/active/{event_id}", response_model=list)
 async def get_active_collectibles(event_id: str):
-    """Get all active (unclaimed) collectibles for an event"""
+    """Get all active (unclaimed) collectibles for an event, newest first"""
     db = await get_database()
 
-    collectibles = await db.collectibles.find({
-        "event_id": event_id,
-        "is_active": True,
-        "claimed_by": None
-    }).to_list(50)
-
-    for coll in collectibles:
-        coll["_id"] = str(coll["_id"])
-
-    return collectibles
+    # Served by the (event_id, is_active, claimed_by, dropped_at) index; the
+    # expiry bound skips drops the periodic sweep has not deactivated yet
+    cursor = db.collectibles.find(
+        {
+            "event_id": event_id,
+            "is_active": True,
+            "claimed_by": None,
+            "expires_at": {"$gt": datetime.now()}
+        },
+        ACTIVE_COLLECTIBLE_PROJECTION
+    ).sort("dropped_at", -1).limit(50).batch_size(25)
+
+    async def stream_json_array():
+        # Encode each document as the driver yields it instead of
+        # materializing the whole list first
+        yield b"["
+        first = True
+        async for doc in cursor:
+            if not first:
+                yield b","
+            yield orjson.dumps(doc, default=str)
+            first = False
+        yield b"]"
+
+    return StreamingResponse(stream_json_array(), media_type="application/json")
 
 
 @router.post("/generate", response_model=dict)
-async def generate_collectible(event_id: str):
+async def generate_collectible(event_id: str, background_tasks: BackgroundTasks):
     """
     Generate a random collectible for a given event.
     - Random rarity (common, rare, epic, legendary)
     - Random name and image
     - Auto timestamps and expiration
     """
-    from app.main import manager
-    from datetime import datetime
-
     db = await get_database()
     collectible_service = CollectibleService(db)
 
@@ -85,20 +102,12 @@ async def generate_collectible(event_id: str):
         location=[-74.0817, 4.6097]
     )
 
-    # Convert datetime objects to ISO strings for JSON serialization
-    collectible_broadcast = {
-        **collectible,
-        "dropped_at": collectible["dropped_at"].isoformat() if isinstance(collectible.get("dropped_at"), datetime) else collectible.get("dropped_at"),
-        "expires_at": collectible["expires_at"].isoformat() if isinstance(collectible.get("expires_at"), datetime) else collectible.get("expires_at"),
-        "created_at": collectible["created_at"].isoformat() if isinstance(collectible.get("created_at"), datetime) else collectible.get("created_at"),
-    }
-
-    # Broadcast to all event participants
-    await manager.broadcast_to_event(event_id, {
+    # Broadcast to all event participants after responding (orjson encodes the datetimes)
+    background_tasks.add_task(manager.broadcast_to_event, event_id, {
         "type": "collectible_drop",
-        "collectible": collectible_broadcast,
+        "collectible": collectible,
         "expires_in": 30,
-        "timestamp": datetime.now().isoformat()
+        "ts_ms": time.time_ns() // 1_000_000
     })
 
-    return {"success": True, "collectible": collectible_broadcast}
\ No newline at end of file
+    return {"success": True, "collectible": collectible}
\ No newline at end of file
@@ -1,12 +1,18 @@
 from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timezone
 from bson import ObjectId
+import asyncio
 import logging
+import time
 
 from app.database import get_database
+from app.responses import MongoJSONResponse
 from app.models.event import EventCreate, Event
-from app.services.daily_service import DailyService
+from app.services.daily_service import daily_service
+from app.services.user_cache import resolve_user, invalidate_user_profile
+from app.services.ttl_cache import get_cached, remember
+from app.websockets.spatial import haversine_km
 from app.middleware.auth import get_current_user, CognitoUser, get_current_user_optional
 from app.middleware.room_authorization import (
     authorize_room_join,
@@ -15,9 +21,77 @@ from app.middleware.room_authorization import (
     get_user_room_role
 )
 
-router = APIRouter()
+router = APIRouter(default_response_class=MongoJSONResponse)
 logger = logging.getLogger(__name__)
 
+# Short-lived /nearby candidates keyed by (lat, lng) rounded to ~110m, radius
+# and status: {key: (expiry, events)}. Neighbouring users in the same plaza
+# share one $geoNear query around the bucket's center, widened so it covers
+# every point in the bucket; distances, the radius cut-off and the ordering
+# are then worked out from each caller's own point. Local create/join/end
+# writes clear it.
+_nearby_cache: Dict[Tuple[float, float, int, str], Tuple[float, list]] = {}
+NEARBY_CACHE_TTL = 15  # seconds
+NEARBY_CACHE_MAX_SIZE = 10000
+# Diagonal of a 0.001 degree bucket (at most ~157m, at the equator)
+NEARBY_BUCKET_MARGIN_M = 160
+NEARBY_RESULT_LIMIT = 100
+# Candidates fetched per bucket; headroom over the result limit because the
+# bucket center ranks events slightly differently than the caller's point
+NEARBY_CANDIDATE_LIMIT = 200
+
+
+# /nearby returns whole event documents, as it always has; _id is renamed to
+# id and both it and creator_id are stringified in MongoDB
+NEARBY_EVENT_STAGES = [
+    {"$set": {"id": {"$toString": "$_id"}, "creator_id": {"$toString": "$creator_id"}}},
+    {"$unset": "_id"},
+]
+
+
+# Event fields join_event reads: the ACL lists for the role check and the
+# room for the token (duplicate joins are filtered by the update itself)
+JOIN_EVENT_PROJECTION = {
+    "status": 1,
+    "creator_id": 1,
+    "is_private": 1,
+    "moderators": 1,
+    "banned_users": 1,
+    "invited_users": 1,
+    "room.daily_room_name": 1,
+    "room.daily_room_url": 1,
+}
+
+# Event fields end_event reads: the ACL for END_EVENT and the room to delete
+END_EVENT_PROJECTION = {
+    "creator_id": 1,
+    "is_private": 1,
+    "moderators": 1,
+    "banned_users": 1,
+    "invited_users": 1,
+    "room.daily_room_name": 1,
+}
+
+
+def invalidate_nearby_cache():
+    """Drop cached /nearby results after an event is created, joined or ended"""
+    _nearby_cache.clear()
+
+
+def parse_event_id(event_id: str) -> ObjectId:
+    """Path dependency: reject malformed event IDs with 400 before touching MongoDB"""
+    if not ObjectId.is_valid(event_id):
+        raise HTTPException(status_code=400, detail="Invalid event ID")
+    return ObjectId(event_id)
+
+
+async def _delete_orphaned_room(room_name: str):
+    """Delete a Daily.co room whose event was never created, logging (not raising) failures"""
+    try:
+        await daily_service.delete_room(room_name)
+    except Exception as e:
+        logger.error(f"Failed to delete orphaned room {room_name}: {e}")
+
 
 @router.post("", response_model=dict, status_code=201)
 async def create_event(
@@ -30,24 +104,31 @@ async def create_event(
     Requires JWT authentication.
     """
     db = await get_database()
-    daily_service = DailyService()
 
-    # Get MongoDB user by Cognito sub
-    mongo_user = await db.users.find_one({"cognito_sub": current_user.sub})
-    if not mongo_user:
-        raise HTTPException(status_code=404, detail="User profile not found")
+    # Get MongoDB user by Cognito sub and create the Daily.co room concurrently
+    room_name = f"citypulse-{ObjectId()}"
 
-    creator_id = str(mongo_user["_id"])
+    mongo_user, room_info = await asyncio.gather(
+        resolve_user(current_user.sub, db),
+        daily_service.create_room(room_name, max_participants=15),
+        return_exceptions=True
+    )
 
-    # Create Daily.co room
-    room_name = f"citypulse-{ObjectId()}"
+    if isinstance(mongo_user, Exception) or not mongo_user:
+        # Don't leave an orphaned room behind
+        if not isinstance(room_info, Exception):
+            await _delete_orphaned_room(room_name)
+        if isinstance(mongo_user, Exception):
+            raise mongo_user
+        raise HTTPException(status_code=404, detail="User profile not found")
 
-    try:
-        room_info = await daily_service.create_room(room_name, max_participants=15)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create video room: {str(e)}")
+    if isinstance(room_info, Exception):
+        raise HTTPException(status_code=500, detail=f"Failed to create video room: {str(room_info)}")
+
+    creator_id = str(mongo_user["_id"])
 
     # Create event
+    now = datetime.now(timezone.utc)
     event = {
         "title": event_data.title,
         "description": event_data.description,
@@ -79,20 +160,27 @@ async def create_event(
             "total_minutes": 0,
             "peak_participants": 0
         },
-        "starts_at": datetime.now(timezone.utc),
+        "starts_at": now,
         "ends_at": None,
-        "created_at": datetime.now(timezone.utc),
-        "updated_at": datetime.now(timezone.utc)
+        "created_at": now,
+        "updated_at": now
     }
 
-    result = await db.events.insert_one(event)
-    event["_id"] = str(result.inserted_id)
+    try:
+        result = await db.events.insert_one(event)
+    except Exception:
+        await _delete_orphaned_room(room_name)
+        raise
 
-    # Update user stats
+    # Count the event only once it exists
     await db.users.update_one(
         {"_id": mongo_user["_id"]},
         {"$inc": {"stats.events_created": 1}}
     )
+    event["_id"] = str(result.inserted_id)
+
+    invalidate_nearby_cache()
+    invalidate_user_profile(creator_id)
 
     logger.info(f"Event created: {result.inserted_id} by user {current_user.email}")
 
@@ -104,6 +192,31 @@ async def create_event(
     }
 
 
+def nearby_pipeline(lng: float, lat: float, max_distance: float, status: Optional[str] = None) -> list:
+    """
+    Aggregation pipeline behind /events/nearby
+
+    Shared with scripts/init_database.py, which explains it to check the
+    2dsphere index is used.
+    """
+    # $geoNear walks the 2dsphere index and sorts by distance like $near;
+    # the id renaming and stringifying happens server-side
+    return [
+        {
+            "$geoNear": {
+                "near": {"type": "Point", "coordinates": [lng, lat]},
+                "key": "location",
+                "distanceField": "distance_m",
+                "maxDistance": max_distance,
+                "spherical": True,
+                "query": {"status": status} if status else {}
+            }
+        },
+        {"$limit": NEARBY_CANDIDATE_LIMIT},
+        *NEARBY_EVENT_STAGES
+    ]
+
+
 @router.get("/nearby", response_model=list)
 async def get_nearby_events(lng: float, lat: float, max_distance: int = 5000, status: str = None):
     """
@@ -115,59 +228,57 @@ async def get_nearby_events(lng: float, lat: float, max_distance: int = 5000, st
         max_distance: Maximum distance in meters (default 5km)
         status: Filter by status (active, ended, cancelled) - optional, returns all if not provided
     """
+    center_lat, center_lng = round(lat, 3), round(lng, 3)
+    cache_key = (center_lat, center_lng, max_distance, status or "all")
+    cached = get_cached(_nearby_cache, cache_key)
+    if cached is not None:
+        return _nearest_events(cached, lng, lat, max_distance)
+
     db = await get_database()
 
-    # Build query filter
-    query_filter = {
-        "location": {
-            "$near": {
-                "$geometry": {
-                    "type": "Point",
-                    "coordinates": [lng, lat]
-                },
-                "$maxDistance": max_distance
-            }
-        }
-    }
+    pipeline = nearby_pipeline(center_lng, center_lat, max_distance + NEARBY_BUCKET_MARGIN_M, status)
+    cursor = await db.events.aggregate(pipeline)
+    candidates = await cursor.to_list(NEARBY_CANDIDATE_LIMIT)
+
+    remember(_nearby_cache, cache_key, candidates, NEARBY_CACHE_TTL, NEARBY_CACHE_MAX_SIZE)
 
-    # Add status filter if provided
-    if status:
-        query_filter["status"] = status
+    return _nearest_events(candidates, lng, lat, max_distance)
 
-    events = await db.events.find(query_filter).to_list(100)
 
-    # Convert ObjectId to string and map _id to id
-    for event in events:
-        event["id"] = str(event["_id"])
-        event["creator_id"] = str(event["creator_id"])
-        del event["_id"]  # Remove _id field
+def _nearest_events(candidates: list, lng: float, lat: float, max_distance: int) -> list:
+    """Filter and order a bucket's cached candidates by distance from the caller's point"""
+    events = []
+    for event in candidates:
+        event_lng, event_lat = event["location"]["coordinates"][:2]
+        distance_m = haversine_km(lng, lat, event_lng, event_lat) * 1000
+        if distance_m <= max_distance:
+            # Copy: the cached candidates are shared between callers
+            events.append({**event, "distance_m": distance_m})
 
-    return events
+    events.sort(key=lambda event: event["distance_m"])
+    return events[:NEARBY_RESULT_LIMIT]
 
 
 @router.get("/{event_id}", response_model=dict)
-async def get_event(event_id: str):
+async def get_event(event_oid: ObjectId = Depends(parse_event_id)):
     """Get event by ID"""
     db = await get_database()
 
-    try:
-        event = await db.events.find_one({"_id": ObjectId(event_id)})
-    except:
-        raise HTTPException(status_code=400, detail="Invalid event ID")
+    event = await db.events.find_one({"_id": event_oid})
 
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
 
-    event["id"] = str(event["_id"])
-    event["creator_id"] = str(event["creator_id"])
-    del event["_id"]  # Remove _id field
+    # Map _id to id; orjson encodes the remaining ObjectIds in one pass
+    event["id"] = event.pop("_id")
 
-    return event
+    return MongoJSONResponse(event)
 
 
 @router.post("/{event_id}/join", response_model=dict)
 async def join_event(
     event_id: str,
+    event_oid: ObjectId = Depends(parse_event_id),
     current_user: CognitoUser = Depends(get_current_user)
 ):
     """
@@ -181,18 +292,17 @@ async def join_event(
     """
     db = await get_database()
 
-    # Get MongoDB user by Cognito sub
-    user = await db.users.find_one({"cognito_sub": current_user.sub})
+    # Get MongoDB user by Cognito sub and the event in parallel
+    user, event = await asyncio.gather(
+        resolve_user(current_user.sub, db),
+        db.events.find_one({"_id": event_oid}, JOIN_EVENT_PROJECTION)
+    )
+
     if not user:
         raise HTTPException(status_code=404, detail="User profile not found")
 
     user_id = str(user["_id"])
 
-    try:
-        event = await db.events.find_one({"_id": ObjectId(event_id)})
-    except:
-        raise HTTPException(status_code=400, detail="Invalid event ID")
-
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
 
@@ -200,7 +310,7 @@ async def join_event(
         raise HTTPException(status_code=400, detail="Event is not active")
 
     # Room Authorization Check (Scenario 2)
-    role = await get_user_room_role(user_id, event_id, db)
+    role = await get_user_room_role(user_id, event_id, db, event=event)
 
     if role is None:
         logger.warning(f"Unauthorized room access: user={user_id}, event={event_id}")
@@ -215,62 +325,61 @@ async def join_event(
             detail="You have been banned from this event"
         )
 
-    # Check if user already joined (defensive check)
-    participants_list = event.get("participants", [])
-    participant_ids = [p.get("user_id") for p in participants_list]
-    already_joined = user_id in participant_ids
+    logger.info(f"Join attempt - User: {user_id}, Event: {event_id}, Role: {role.value}")
 
-    logger.info(f"Join attempt - User: {user_id}, Event: {event_id}, Role: {role.value}, Already joined: {already_joined}")
+    stats_update = None
+    participant = {
+        "user_id": user_id,
+        "cognito_sub": current_user.sub,
+        "joined_at": datetime.now(timezone.utc),
+        "is_active": True,
+        "role": role.value
+    }
 
-    if not already_joined:
-        # Atomic operation with filter to prevent duplicates
-        result = await db.events.update_one(
+    # Single pipeline update: the filter skips users who already joined, the
+    # first stage appends and counts, the second raises the peak from the
+    # new count, so there is no re-read or separate peak write
+    result = await db.events.update_one(
+        {
+            "_id": event_oid,
+            "participants.user_id": {"$ne": user_id}
+        },
+        [
             {
-                "_id": ObjectId(event_id),
-                "participants.user_id": {"$ne": user_id}
+                "$set": {
+                    "participants": {
+                        "$concatArrays": [
+                            {"$ifNull": ["$participants", []]},
+                            {"$literal": [participant]}
+                        ]
+                    },
+                    "room.current_participants": {"$add": [{"$ifNull": ["$room.current_participants", 0]}, 1]},
+                    "metadata.views": {"$add": [{"$ifNull": ["$metadata.views", 0]}, 1]},
+                    "updated_at": "$$NOW"
+                }
             },
             {
-                "$push": {
-                    "participants": {
-                        "user_id": user_id,
-                        "cognito_sub": current_user.sub,
-                        "joined_at": datetime.now(timezone.utc),
-                        "is_active": True,
-                        "role": role.value
-                    }
-                },
-                "$inc": {
-                    "room.current_participants": 1,
-                    "metadata.views": 1
-                },
                 "$set": {
-                    "updated_at": datetime.now(timezone.utc)
+                    "metadata.peak_participants": {
+                        "$max": ["$metadata.peak_participants", "$room.current_participants"]
+                    }
                 }
             }
-        )
+        ]
+    )
+
+    logger.info(f"Join result - Modified: {result.modified_count}")
+
+    if result.modified_count > 0:
+        invalidate_nearby_cache()
 
-        logger.info(f"Join result - Modified: {result.modified_count}")
-
-        if result.modified_count > 0:
-            # Update peak_participants
-            updated_event = await db.events.find_one({"_id": ObjectId(event_id)})
-            if updated_event:
-                current_count = updated_event["room"]["current_participants"]
-                peak = updated_event["metadata"]["peak_participants"]
-                if current_count > peak:
-                    await db.events.update_one(
-                        {"_id": ObjectId(event_id)},
-                        {"$set": {"metadata.peak_participants": current_count}}
-                    )
-
-            # Update user stats
-            await db.users.update_one(
-                {"_id": user["_id"]},
-                {"$inc": {"stats.events_attended": 1}}
-            )
+        # Update user stats while the meeting token is generated
+        stats_update = asyncio.create_task(db.users.update_one(
+            {"_id": user["_id"]},
+            {"$inc": {"stats.events_attended": 1}}
+        ))
 
     # Generate Daily.co meeting token
-    daily_service = DailyService()
     is_owner = str(event.get("creator_id")) == user_id
 
     try:
@@ -282,6 +391,10 @@ async def join_event(
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create meeting token: {str(e)}")
+    finally:
+        if stats_update is not None:
+            await stats_update
+            invalidate_user_profile(user_id)
 
     return {
         "event_id": event_id,
@@ -295,6 +408,7 @@ async def join_event(
 @router.post("/{event_id}/end", response_model=dict)
 async def end_event(
     event_id: str,
+    event_oid: ObjectId = Depends(parse_event_id),
     current_user: CognitoUser = Depends(get_current_user)
 ):
     """
@@ -305,29 +419,25 @@ async def end_event(
     db = await get_database()
 
     # Get MongoDB user
-    user = await db.users.find_one({"cognito_sub": current_user.sub})
+    user = await resolve_user(current_user.sub, db)
     if not user:
         raise HTTPException(status_code=404, detail="User profile not found")
 
     user_id = str(user["_id"])
 
-    try:
-        event = await db.events.find_one({"_id": ObjectId(event_id)})
-    except:
-        raise HTTPException(status_code=400, detail="Invalid event ID")
+    event = await db.events.find_one({"_id": event_oid}, END_EVENT_PROJECTION)
 
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
 
     # Authorization: Only creator can end event
-    if not await authorize_room_action(event_id, RoomPermission.END_EVENT, current_user):
+    if not await authorize_room_action(event_id, RoomPermission.END_EVENT, current_user, event=event):
         # Double-check with direct comparison
         if str(event["creator_id"]) != user_id:
             logger.warning(f"Unauthorized end event attempt: user={user_id}, event={event_id}")
             raise HTTPException(status_code=403, detail="Only the creator can end the event")
 
     # Delete Daily.co room to save resources
-    daily_service = DailyService()
     room_name = event.get("room", {}).get("daily_room_name")
 
     if room_name:
@@ -337,28 +447,31 @@ async def end_event(
         except Exception as e:
             logger.warning(f"Failed to delete Daily.co room {room_name}: {str(e)}")
 
-    # Calculate total duration in minutes
-    now = datetime.now(timezone.utc)
-    starts_at = event.get("starts_at", now)
-
-    if starts_at.tzinfo is None:
-        starts_at = starts_at.replace(tzinfo=timezone.utc)
-
-    duration_minutes = int((now - starts_at).total_seconds() / 60)
-
-    # Update event status
+    # Update event status; the server computes the duration from its own
+    # clock, so naive and aware starts_at values are handled the same way
     await db.events.update_one(
-        {"_id": ObjectId(event_id)},
-        {
-            "$set": {
-                "status": "ended",
-                "ends_at": now,
-                "updated_at": now,
-                "metadata.total_minutes": duration_minutes
+        {"_id": event_oid},
+        [
+            {
+                "$set": {
+                    "status": "ended",
+                    "ends_at": "$$NOW",
+                    "updated_at": "$$NOW",
+                    "metadata.total_minutes": {
+                        "$toInt": {
+                            "$divide": [
+                                {"$subtract": ["$$NOW", {"$ifNull": ["$starts_at", "$$NOW"]}]},
+                                60000
+                            ]
+                        }
+                    }
+                }
             }
-        }
+        ]
     )
 
+    invalidate_nearby_cache()
+
     logger.info(f"Event ended: {event_id} by user {current_user.email}")
 
     return {"message": "Event ended successfully"}
@@ -1,12 +1,76 @@
 from fastapi import APIRouter, HTTPException
+from typing import Optional, Tuple
+import asyncio
 import httpx
 import logging
+import time
 
 from app.config import settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Shared HTTP client for the Deepgram API (keeps the TLS connection alive)
+_deepgram_client = httpx.AsyncClient(base_url="https://api.deepgram.com", timeout=10.0)
+
+# Temporary keys last an hour, so one key is shared by every client until it
+# is close to expiring: (key, monotonic expiry)
+_cached_key: Optional[Tuple[str, float]] = None
+_key_lock = asyncio.Lock()
+KEY_TTL = 3600  # seconds
+KEY_REFRESH_MARGIN = 300  # stop handing out a key 5 minutes before it expires
+
+
+async def close_deepgram_client():
+    """Close the shared Deepgram HTTP client (called on app shutdown)"""
+    await _deepgram_client.aclose()
+
+
+def _cached_token() -> Optional[dict]:
+    """The shared temporary key with its remaining lifetime, if still fresh"""
+    if _cached_key is None:
+        return None
+    key, expires_at = _cached_key
+    remaining = expires_at - time.monotonic()
+    if remaining <= KEY_REFRESH_MARGIN:
+        return None
+    return {"key": key, "expires_in": int(remaining)}
+
+
+async def _create_temporary_key() -> dict:
+    """Create a temporary project key and cache it (falls back to the main key)"""
+    global _cached_key
+
+    # Create a temporary project key (expires after some time)
+    response = await _deepgram_client.post(
+        "/v1/keys",
+        headers={
+            "Authorization": f"Token {settings.DEEPGRAM_API_KEY}",
+            "Content-Type": "application/json"
+        },
+        json={
+            "comment": "Temporary key for CityPulse Live transcription",
+            "scopes": ["usage:write"],
+            "time_to_live_in_seconds": KEY_TTL  # 1 hour
+        }
+    )
+
+    if response.status_code == 201:
+        data = response.json()
+        expires_in = data.get("time_to_live_in_seconds", KEY_TTL)
+        _cached_key = (data["key"], time.monotonic() + expires_in)
+        return {
+            "key": data["key"],
+            "expires_in": expires_in
+        }
+    else:
+        # If temporary key creation fails, return the main key (less secure but works)
+        logger.warning(f"Failed to create temporary Deepgram key: {response.status_code}")
+        return {
+            "key": settings.DEEPGRAM_API_KEY,
+            "expires_in": 3600
+        }
+
 
 @router.get("/token", response_model=dict)
 async def get_deepgram_token():
@@ -17,36 +81,17 @@ async def get_deepgram_token():
     if not settings.DEEPGRAM_API_KEY:
         raise HTTPException(status_code=500, detail="Deepgram API key not configured")
 
+    token = _cached_token()
+    if token:
+        return token
+
     try:
-        # Create a temporary project key (expires after some time)
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.deepgram.com/v1/keys",
-                headers={
-                    "Authorization": f"Token {settings.DEEPGRAM_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "comment": "Temporary key for CityPulse Live transcription",
-                    "scopes": ["usage:write"],
-                    "time_to_live_in_seconds": 3600  # 1 hour
-                },
-                timeout=10.0
-            )
-
-            if response.status_code == 201:
-                data = response.json()
-                return {
-                    "key": data["key"],
-                    "expires_in": data.get("time_to_live_in_seconds", 3600)
-                }
-            else:
-                # If temporary key creation fails, return the main key (less secure but works)
-                logger.warning(f"Failed to create temporary Deepgram key: {response.status_code}")
-                return {
-                    "key": settings.DEEPGRAM_API_KEY,
-                    "expires_in": 3600
-                }
+        # Only one request creates a new key; the rest wait and reuse it
+        async with _key_lock:
+            token = _cached_token()
+            if token:
+                return token
+            return await _create_temporary_key()
 
     except Exception as e:
         logger.error(f"Error getting Deepgram token: {e}")
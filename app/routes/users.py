@@ -2,14 +2,24 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 from app.database import get_database
+from app.responses import MongoJSONResponse
 from app.models.user import UserCreate, UserResponse, User
 from app.middleware.auth import get_current_user, CognitoUser
+from app.services.user_cache import resolve_user, get_user_profile, PROFILE_PROJECTION
 
 router = APIRouter()
 
 
+def parse_user_id(user_id: str) -> ObjectId:
+    """Path dependency: reject malformed user IDs with 400 before touching MongoDB"""
+    if not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="Invalid user ID")
+    return ObjectId(user_id)
+
+
 @router.get("/me", response_model=dict)
 async def get_current_user_profile(current_user: CognitoUser = Depends(get_current_user)):
     """
@@ -19,8 +29,10 @@ async def get_current_user_profile(current_user: CognitoUser = Depends(get_curre
     """
     db = await get_database()
 
-    # Try to find user by cognito_id (sub) first
-    user = await db.users.find_one({"cognito_id": current_user.sub})
+    # Cognito users are stored with cognito_sub; both lookups are cached
+    user = await resolve_user(current_user.sub, db)
+    if user:
+        user = await get_user_profile(user["_id"], db)
 
     if user:
         return {
@@ -53,12 +65,7 @@ async def register_user(user_data: UserCreate):
     """
     db = await get_database()
 
-    # Check if phone already exists
-    existing_user = await db.users.find_one({"phone": user_data.phone})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Phone number already registered")
-
-    # Create new user
+    # Create new user; the unique phone index (built at startup) rejects duplicates atomically
     user = {
         "phone": user_data.phone,
         "name": user_data.name,
@@ -73,7 +80,10 @@ async def register_user(user_data: UserCreate):
         "updated_at": datetime.now()
     }
 
-    result = await db.users.insert_one(user)
+    try:
+        result = await db.users.insert_one(user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Phone number already registered")
 
     return {
         "id": str(result.inserted_id),
@@ -84,14 +94,12 @@ async def register_user(user_data: UserCreate):
 
 
 @router.get("/{user_id}", response_model=dict)
-async def get_user(user_id: str):
+async def get_user(user_oid: ObjectId = Depends(parse_user_id)):
     """Get user by ID"""
     db = await get_database()
 
-    try:
-        user = await db.users.find_one({"_id": ObjectId(user_id)})
-    except:
-        raise HTTPException(status_code=400, detail="Invalid user ID")
+    # Outside any try: a database failure is a 500, not a bad ID
+    user = await get_user_profile(user_oid, db)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -113,7 +121,7 @@ async def login_user(user_data: UserCreate):
     db = await get_database()
 
     # Find user by phone
-    user = await db.users.find_one({"phone": user_data.phone})
+    user = await db.users.find_one({"phone": user_data.phone}, PROFILE_PROJECTION)
 
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado. Por favor regístrate primero.")
@@ -128,19 +136,8 @@ async def login_user(user_data: UserCreate):
     }
 
 
-def convert_objectids_to_strings(obj):
-    """Recursively convert all ObjectIds to strings in a dict/list"""
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    elif isinstance(obj, dict):
-        return {key: convert_objectids_to_strings(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_objectids_to_strings(item) for item in obj]
-    else:
-        return obj
-
 @router.get("/{user_id}/collectibles", response_model=list)
-async def get_user_collectibles(user_id: str):
+async def get_user_collectibles(user_oid: ObjectId = Depends(parse_user_id)):
     """Get all collectibles owned by user"""
     try:
         db = await get_database()
@@ -148,12 +145,10 @@ async def get_user_collectibles(user_id: str):
         from app.services.collectible_service import CollectibleService
         collectible_service = CollectibleService(db)
 
-        inventory = await collectible_service.get_user_inventory(user_id)
-
-        # Convert ALL ObjectIds to strings recursively
-        inventory = convert_objectids_to_strings(inventory)
+        inventory = await collectible_service.get_user_inventory(user_oid)
 
-        return inventory
+        # orjson encodes the nested ObjectIds in one native pass
+        return MongoJSONResponse(inventory)
     except Exception as e:
         print(f"❌ Error in get_user_collectibles endpoint: {e}")
         import traceback
@@ -1,9 +1,31 @@
 from pymongo import ReturnDocument
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from bson import ObjectId
+import asyncio
+import bisect
 import random
 
+from app.services.user_cache import invalidate_user_profile
+
+RARITY_CONFIG = {
+    "common": {"score": 10, "name": "Bogotá Citizen"},
+    "rare": {"score": 30, "name": "City Explorer"},
+    "epic": {"score": 60, "name": "Urban Legend"},
+    "legendary": {"score": 100, "name": "CityPulse Icon"}
+}
+
+
+# Drop odds as a cumulative distribution: common 50%, rare 30%, epic 15%,
+# legendary 5%
+RARITIES = ("common", "rare", "epic", "legendary")
+RARITY_CDF = (0.5, 0.8, 0.95, 1.0)
+
+
+def random_rarity() -> str:
+    """Random rarity based on probability"""
+    return RARITIES[bisect.bisect_right(RARITY_CDF, random.random())]
+
 
 class CollectibleService:
     """Service for handling collectibles with race condition safety"""
@@ -13,41 +35,25 @@ class CollectibleService:
         self.collectibles = db.collectibles
         self.user_collectibles = db.user_collectibles
 
-    async def create_collectible(
-            self,
+    @staticmethod
+    def _build_collectible(
             event_id: str,
-            rarity: str = "common",
-            drop_location: List[float] = None
+            rarity: str,
+            drop_location: Optional[List[float]],
+            now: datetime
     ) -> Dict:
-        """
-        Create a new collectible for an event
-
-        Args:
-            event_id: Event identifier
-            rarity: common, rare, epic, legendary
-            drop_location: [longitude, latitude]
-
-        Returns:
-            Created collectible document
-        """
-        rarity_config = {
-            "common": {"score": 10, "name": "Bogotá Citizen"},
-            "rare": {"score": 30, "name": "City Explorer"},
-            "epic": {"score": 60, "name": "Urban Legend"},
-            "legendary": {"score": 100, "name": "CityPulse Icon"}
-        }
+        """Build a collectible document (timestamps all come from `now`)"""
+        config = RARITY_CONFIG.get(rarity, RARITY_CONFIG["common"])
 
-        config = rarity_config.get(rarity, rarity_config["common"])
-
-        collectible = {
+        return {
             "name": config["name"],
             "type": rarity,
             "rarity_score": config["score"],
             "image_url": f"/collectibles/{rarity}.svg",
             "description": f"Limited edition {rarity} collectible",
             "event_id": event_id,
-            "dropped_at": datetime.now(),
-            "expires_at": datetime.now() + timedelta(seconds=30),  # 30 sec to claim
+            "dropped_at": now,
+            "expires_at": now + timedelta(seconds=30),  # 30 sec to claim
             "claimed_by": None,
             "claimed_at": None,
             "drop_location": {
@@ -60,14 +66,59 @@ class CollectibleService:
                 "claim_attempts": 0,
                 "successful_claims": 0
             },
-            "created_at": datetime.now()
+            "created_at": now
         }
 
+    async def create_collectible(
+            self,
+            event_id: str,
+            rarity: str = "common",
+            drop_location: List[float] = None
+    ) -> Dict:
+        """
+        Create a new collectible for an event
+
+        Args:
+            event_id: Event identifier
+            rarity: common, rare, epic, legendary
+            drop_location: [longitude, latitude]
+
+        Returns:
+            Created collectible document
+        """
+        collectible = self._build_collectible(event_id, rarity, drop_location, datetime.now())
+
         result = await self.collectibles.insert_one(collectible)
         collectible["_id"] = str(result.inserted_id)
 
         return collectible
 
+    async def create_collectibles_bulk(self, drops: List[Tuple[str, str, List[float]]]) -> List[Dict]:
+        """
+        Create several collectibles in one round trip
+
+        Args:
+            drops: (event_id, rarity, drop_location) per collectible
+
+        Returns:
+            Created collectible documents, in the same order as `drops`
+        """
+        if not drops:
+            return []
+
+        now = datetime.now()
+        collectibles = [
+            self._build_collectible(event_id, rarity, drop_location, now)
+            for event_id, rarity, drop_location in drops
+        ]
+
+        # Unordered: one failed document does not stop the rest of the batch
+        result = await self.collectibles.insert_many(collectibles, ordered=False)
+        for collectible, inserted_id in zip(collectibles, result.inserted_ids):
+            collectible["_id"] = str(inserted_id)
+
+        return collectibles
+
     async def claim_collectible(
             self,
             collectible_id: str,
@@ -87,33 +138,45 @@ class CollectibleService:
         Returns:
             Result with success status and message
         """
+        # Validate both ids before the claim; a bad user_id must not fail
+        # after the collectible has already been taken
+        if not ObjectId.is_valid(collectible_id):
+            return {
+                "success": False,
+                "message": "Invalid collectible ID"
+            }
+        if not ObjectId.is_valid(user_id):
+            return {
+                "success": False,
+                "message": "Invalid user ID"
+            }
+
         try:
             coll_oid = ObjectId(collectible_id)
+            user_oid = ObjectId(user_id)
 
             print(f"🎯 Claim attempt - User: {user_id}, Collectible: {collectible_id}")
 
-            # Increment attempt counter (for analytics)
-            await self.collectibles.update_one(
-                {"_id": coll_oid},
-                {"$inc": {"metadata.claim_attempts": 1}}
-            )
+            now = datetime.now()
 
             # ATOMIC OPERATION - This is the key!
-            # MongoDB will only update if ALL conditions match
+            # MongoDB will only update if ALL conditions match, so the
+            # claim is a single compare-and-swap with no read beforehand
             result = await self.collectibles.find_one_and_update(
                 filter={
                     "_id": coll_oid,
                     "claimed_by": None,  # MUST be unclaimed
                     "is_active": True,  # MUST be active
-                    "expires_at": {"$gt": datetime.now()}  # NOT expired
+                    "expires_at": {"$gt": now}  # NOT expired
                 },
                 update={
                     "$set": {
                         "claimed_by": user_id,
-                        "claimed_at": datetime.now(),
+                        "claimed_at": now,
                         "is_active": False
                     },
                     "$inc": {
+                        "metadata.claim_attempts": 1,  # For analytics
                         "metadata.successful_claims": 1
                     }
                 },
@@ -121,8 +184,14 @@ class CollectibleService:
             )
 
             if result is None:
-                # Someone else claimed it first OR it expired
-                collectible = await self.collectibles.find_one({"_id": coll_oid})
+                # Someone else claimed it first OR it expired; count the
+                # attempt and read back why in the same round trip
+                collectible = await self.collectibles.find_one_and_update(
+                    {"_id": coll_oid},
+                    {"$inc": {"metadata.claim_attempts": 1}},
+                    projection={"claimed_by": 1, "expires_at": 1},
+                    return_document=ReturnDocument.AFTER
+                )
 
                 if collectible and collectible["claimed_by"]:
                     print(f"❌ Already claimed by: {collectible['claimed_by']}")
@@ -131,7 +200,7 @@ class CollectibleService:
                         "message": "Someone else claimed it first!",
                         "claimed_by": str(collectible["claimed_by"])
                     }
-                elif collectible and collectible["expires_at"] < datetime.now():
+                elif collectible and collectible["expires_at"] < now:
                     print(f"⏰ Collectible expired at {collectible['expires_at']}")
                     return {
                         "success": False,
@@ -147,28 +216,35 @@ class CollectibleService:
             # SUCCESS! You got it!
             print(f"✅ Claim successful! User {user_id} got {result['name']} ({result['type']})")
 
-            # Add to user's inventory
-            inventory_doc = await self.user_collectibles.insert_one({
-                "user_id": user_id,
-                "collectible_id": coll_oid,  # Store as ObjectId for $lookup to work
-                "claimed_at": datetime.now(),
-                "claim_order": result["metadata"]["successful_claims"],
-                "event_id": result["event_id"]
-            })
-            print(f"📦 Added to user_collectibles with _id: {inventory_doc.inserted_id}")
-
-            # Update user stats
-            await self.db.users.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$inc": {"stats.collectibles_count": 1}}
+            # Add to user's inventory with a snapshot of the collectible
+            # (immutable once claimed), so reading the inventory needs no join.
+            # The stats update is independent and runs concurrently; it also
+            # returns the winner's name for the claim broadcast
+            inventory_doc, winner = await asyncio.gather(
+                self.user_collectibles.insert_one({
+                    "user_id": user_oid,
+                    "collectible_id": coll_oid,
+                    "claimed_at": now,
+                    "claim_order": result["metadata"]["successful_claims"],
+                    "event_id": result["event_id"],
+                    "collectible": result
+                }),
+                self.db.users.find_one_and_update(
+                    {"_id": user_oid},
+                    {"$inc": {"stats.collectibles_count": 1}},
+                    projection={"name": 1}
+                )
             )
+            print(f"📦 Added to user_collectibles with _id: {inventory_doc.inserted_id}")
+            invalidate_user_profile(user_id)
             print(f"📊 Updated user stats")
 
             return {
                 "success": True,
                 "message": "Collectible claimed successfully!",
                 "collectible": result,
-                "claim_order": result["metadata"]["successful_claims"]
+                "claim_order": result["metadata"]["successful_claims"],
+                "winner_name": winner.get("name") if winner else None
             }
 
         except Exception as e:
@@ -183,21 +259,20 @@ class CollectibleService:
         Drop a random collectible in an event
         (Called by background task or event trigger)
         """
-        # Random rarity based on probability
-        rand = random.random()
-        if rand < 0.5:
-            rarity = "common"  # 50%
-        elif rand < 0.8:
-            rarity = "rare"  # 30%
-        elif rand < 0.95:
-            rarity = "epic"  # 15%
-        else:
-            rarity = "legendary"  # 5%
+        collectible = await self.create_collectible(event_id, random_rarity(), location)
 
+        return collectible
 
-        collectible = await self.create_collectible(event_id, rarity, location)
+    async def drop_random_collectibles(self, drops: List[Tuple[str, List[float]]]) -> List[Dict]:
+        """
+        Drop one random collectible in each of several events with a single insert
 
-        return collectible
+        Args:
+            drops: (event_id, location) per event
+        """
+        return await self.create_collectibles_bulk(
+            [(event_id, random_rarity(), location) for event_id, location in drops]
+        )
 
     async def expire_old_collectibles(self):
         """
@@ -215,28 +290,31 @@ class CollectibleService:
 
         return result.modified_count
 
-    async def get_user_inventory(self, user_id: str) -> list:
-        """Get all collectibles owned by a user"""
-        pipeline = [
-            {"$match": {"user_id": user_id}},
-            {
-                "$lookup": {
-                    "from": "collectibles",
-                    "localField": "collectible_id",
-                    "foreignField": "_id",
-                    "as": "collectible"
+    async def get_user_inventory(self, user_oid: ObjectId) -> list:
+        """Get all collectibles owned by a user, newest claim first"""
+        try:
+            # Range scans on the (user_id, claimed_at) index; claims embed a
+            # snapshot of the collectible. user_id is stored as an ObjectId,
+            # older claims still hold the hex string
+            results = await self.user_collectibles.find(
+                {"user_id": {"$in": [user_oid, str(user_oid)]}}
+            ).sort("claimed_at", -1).to_list(None)
+
+            # Claims recorded before snapshots were embedded are joined with
+            # one $in query instead of a $lookup per entry
+            legacy_ids = [r["collectible_id"] for r in results if "collectible" not in r]
+            if legacy_ids:
+                collectibles = {
+                    doc["_id"]: doc
+                    async for doc in self.collectibles.find({"_id": {"$in": legacy_ids}})
                 }
-            },
-            {"$unwind": {
-                "path": "$collectible",
-                "preserveNullAndEmptyArrays": False  # Skip if no match (don't fail)
-            }},
-            {"$sort": {"claimed_at": -1}}
-        ]
+                for entry in results:
+                    if "collectible" not in entry:
+                        entry["collectible"] = collectibles.get(entry["collectible_id"])
+                # Skip entries whose collectible no longer exists
+                results = [r for r in results if r["collectible"] is not None]
 
-        try:
-            results = await self.user_collectibles.aggregate(pipeline).to_list(None)
-            print(f"📦 Found {len(results)} collectibles for user {user_id}")
+            print(f"📦 Found {len(results)} collectibles for user {user_oid}")
             return results
         except Exception as e:
             print(f"❌ Error getting user inventory: {e}")
@@ -1,7 +1,23 @@
 import httpx
-from typing import Dict, Optional
+import time
+from typing import Dict, Optional, Tuple
 from datetime import datetime, timedelta
 from app.config import settings
+from app.services.ttl_cache import get_cached, remember
+
+# Shared HTTP client for the Daily.co API (keeps TLS connections alive between requests)
+_daily_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    timeout=10.0
+)
+
+# {room_name: (expiry, room data)} - room config does not change after creation
+_room_cache: Dict[str, Tuple[float, Dict]] = {}
+ROOM_CACHE_TTL = 3600  # seconds, capped at the room's own exp
+# {room_name: (expiry, participants)} - presence changes often; absorbs bursty polling
+_presence_cache: Dict[str, Tuple[float, list]] = {}
+PRESENCE_CACHE_TTL = 3  # seconds
+DAILY_CACHE_MAX_SIZE = 10000
 
 
 class DailyService:
@@ -35,33 +51,32 @@ class DailyService:
         # Calculate expiration timestamp (4 hours from now)
         exp_timestamp = int((datetime.now() + timedelta(hours=4)).timestamp())
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/rooms",
-                headers=self.headers,
-                json={
-                    "name": room_name,
-                    "properties": {
-                        "max_participants": max_participants,
-                        "enable_screenshare": True,
-                        "enable_chat": True,
-                        "start_video_off": False,
-                        "start_audio_off": False,
-                        "exp": exp_timestamp  # Room expires in 4 hours
-                    }
-                }
-            )
-
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "room_name": data["name"],
-                    "room_url": data["url"],
-                    "created_at": data["created_at"],
-                    "config": data["config"]
+        response = await _daily_client.post(
+            f"{self.base_url}/rooms",
+            headers=self.headers,
+            json={
+                "name": room_name,
+                "properties": {
+                    "max_participants": max_participants,
+                    "enable_screenshare": True,
+                    "enable_chat": True,
+                    "start_video_off": False,
+                    "start_audio_off": False,
+                    "exp": exp_timestamp  # Room expires in 4 hours
                 }
-            else:
-                raise Exception(f"Failed to create Daily room: {response.text}")
+            }
+        )
+
+        if response.status_code == 200:
+            data = response.json()
+            return {
+                "room_name": data["name"],
+                "room_url": data["url"],
+                "created_at": data["created_at"],
+                "config": data["config"]
+            }
+        else:
+            raise Exception(f"Failed to create Daily room: {response.text}")
 
     async def create_meeting_token(
         self,
@@ -82,64 +97,89 @@ class DailyService:
         Returns:
             Meeting token string
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/meeting-tokens",
-                headers=self.headers,
-                json={
-                    "properties": {
-                        "room_name": room_name,
-                        "user_name": username,
-                        "user_id": user_id,
-                        "is_owner": is_owner,
-                        "enable_screenshare": True,
-                        "start_video_off": False,
-                        "start_audio_off": False,
-                        "exp": int((datetime.now() + timedelta(hours=4)).timestamp())
-                    }
+        response = await _daily_client.post(
+            f"{self.base_url}/meeting-tokens",
+            headers=self.headers,
+            json={
+                "properties": {
+                    "room_name": room_name,
+                    "user_name": username,
+                    "user_id": user_id,
+                    "is_owner": is_owner,
+                    "enable_screenshare": True,
+                    "start_video_off": False,
+                    "start_audio_off": False,
+                    "exp": int((datetime.now() + timedelta(hours=4)).timestamp())
                 }
-            )
+            }
+        )
 
-            if response.status_code == 200:
-                data = response.json()
-                return data["token"]
-            else:
-                raise Exception(f"Failed to create meeting token: {response.text}")
+        if response.status_code == 200:
+            data = response.json()
+            return data["token"]
+        else:
+            raise Exception(f"Failed to create meeting token: {response.text}")
 
     async def get_room_info(self, room_name: str) -> Optional[Dict]:
         """Get information about a specific room"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/rooms/{room_name}",
-                headers=self.headers
-            )
-
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return None
+        room = get_cached(_room_cache, room_name)
+        if room is not None:
+            return room
+
+        response = await _daily_client.get(
+            f"{self.base_url}/rooms/{room_name}",
+            headers=self.headers
+        )
+
+        if response.status_code == 200:
+            room = response.json()
+            ttl = ROOM_CACHE_TTL
+            exp = (room.get("config") or {}).get("exp")
+            if exp:
+                ttl = min(ttl, exp - time.time())
+            if ttl > 0:
+                remember(_room_cache, room_name, room, ttl, DAILY_CACHE_MAX_SIZE)
+            return room
+        else:
+            return None
 
     async def delete_room(self, room_name: str) -> bool:
         """Delete a room when event ends"""
-        async with httpx.AsyncClient() as client:
-            response = await client.delete(
-                f"{self.base_url}/rooms/{room_name}",
-                headers=self.headers
-            )
+        _room_cache.pop(room_name, None)
+        _presence_cache.pop(room_name, None)
+
+        response = await _daily_client.delete(
+            f"{self.base_url}/rooms/{room_name}",
+            headers=self.headers
+        )
 
-            return response.status_code == 200
+        return response.status_code == 200
 
     async def get_active_participants(self, room_name: str) -> list:
         """Get list of current participants in a room"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/presence",
-                headers=self.headers,
-                params={"room": room_name}
-            )
-
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("data", [])
-            else:
-                return []
+        participants = get_cached(_presence_cache, room_name)
+        if participants is not None:
+            return participants
+
+        response = await _daily_client.get(
+            f"{self.base_url}/presence",
+            headers=self.headers,
+            params={"room": room_name}
+        )
+
+        if response.status_code == 200:
+            data = response.json()
+            participants = data.get("data", [])
+            remember(_presence_cache, room_name, participants, PRESENCE_CACHE_TTL, DAILY_CACHE_MAX_SIZE)
+            return participants
+        else:
+            return []
+
+
+async def close_daily_client():
+    """Close the shared Daily.co HTTP client (called on app shutdown)"""
+    await _daily_client.aclose()
+
+
+# Global Daily.co service instance
+daily_service = DailyService()
@@ -2,6 +2,7 @@ from deepgram import DeepgramClient, LiveTranscriptionEvents, LiveOptions
 from typing import Callable, Optional
 from datetime import datetime
 import asyncio
+import time
 from app.config import settings
 
 
@@ -12,6 +13,24 @@ class DeepgramService:
         self.api_key = settings.DEEPGRAM_API_KEY
         self.client = DeepgramClient(self.api_key) if self.api_key else None
         self.connection = None
+        self._transcripts: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def _dispatch_transcripts(self, on_transcript: Callable, language: str):
+        """Deliver queued transcripts to the callback, one at a time, in order"""
+        while True:
+            sentence, is_final, confidence, speaker, received_at = await self._transcripts.get()
+            try:
+                await on_transcript({
+                    "text": sentence,
+                    "is_final": is_final,
+                    "confidence": confidence,
+                    "speaker": speaker,
+                    "language": language,
+                    "timestamp": datetime.fromtimestamp(received_at)
+                })
+            except Exception as e:
+                print(f"Error handling Deepgram transcript: {e}")
 
     async def start_streaming(
         self,
@@ -48,26 +67,28 @@ class DeepgramService:
             # Create websocket connection
             self.connection = self.client.listen.live.v("1")
 
+            # The SDK fires callbacks on its own thread: hand transcripts to
+            # the event loop through a queue drained by a single worker task
+            # instead of scheduling a task per interim result
+            loop = asyncio.get_running_loop()
+            transcripts = self._transcripts = asyncio.Queue()
+            self._dispatcher = asyncio.create_task(self._dispatch_transcripts(on_transcript, language))
+
             # Event handlers
             @self.connection.on(LiveTranscriptionEvents.Transcript)
             def on_message(self, result, **kwargs):
-                sentence = result.channel.alternatives[0].transcript
+                alternative = result.channel.alternatives[0]
+                sentence = alternative.transcript
 
                 if len(sentence) > 0:
                     # Get speaker info if available
-                    speaker = None
-                    if result.channel.alternatives[0].words:
-                        speaker = result.channel.alternatives[0].words[0].speaker
-
-                    # Call the callback
-                    asyncio.create_task(on_transcript({
-                        "text": sentence,
-                        "is_final": result.is_final,
-                        "confidence": result.channel.alternatives[0].confidence,
-                        "speaker": speaker,
-                        "language": language,
-                        "timestamp": datetime.now()
-                    }))
+                    speaker = alternative.words[0].speaker if alternative.words else None
+
+                    # Queue for the callback
+                    loop.call_soon_threadsafe(
+                        transcripts.put_nowait,
+                        (sentence, result.is_final, alternative.confidence, speaker, time.time())
+                    )
 
             @self.connection.on(LiveTranscriptionEvents.Error)
             def on_error(self, error, **kwargs):
@@ -85,11 +106,19 @@ class DeepgramService:
 
     async def send_audio(self, audio_data: bytes):
         """Send audio chunk to Deepgram"""
-        if self.connection:
-            self.connection.send(audio_data)
+        connection = self.connection
+        if connection:
+            # The live client's send is a blocking websocket write
+            await asyncio.to_thread(connection.send, audio_data)
 
     async def stop_streaming(self):
         """Stop the streaming connection"""
-        if self.connection:
-            self.connection.finish()
-            self.connection = None
+        connection, self.connection = self.connection, None
+        if connection:
+            # finish() closes the socket and joins the SDK's threads
+            await asyncio.to_thread(connection.finish)
+
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+            self._transcripts = None
@@ -0,0 +1,38 @@
+from typing import List
+
+from app.models.transcription import TranscriptSegment
+
+
+class TranscriptionService:
+    """Service for persisting live transcription output"""
+
+    def __init__(self, db):
+        self.db = db
+        self.transcriptions = db.transcriptions
+        self.segments = db.transcription_segments
+
+    async def save_segments(self, transcription_id: str, segments: List[TranscriptSegment]) -> int:
+        """
+        Append a batch of transcript segments in one round trip
+
+        Segments are stored in their own collection (indexed by
+        transcription_id, start_time) instead of being pushed one at a time
+        onto the transcription document. ordered=False lets the server apply
+        the batch in parallel and keep going past a failed document.
+
+        Args:
+            transcription_id: Transcription the segments belong to
+            segments: Segments from one live chunk
+
+        Returns:
+            Number of segments inserted
+        """
+        if not segments:
+            return 0
+
+        docs = [
+            {**segment.model_dump(), "transcription_id": transcription_id}
+            for segment in segments
+        ]
+        result = await self.segments.insert_many(docs, ordered=False)
+        return len(result.inserted_ids)
@@ -0,0 +1,42 @@
+"""
+In-process TTL caches
+
+The per-worker caches (resolved users, profiles, Daily rooms and presence,
+room roles, verified tokens, /nearby candidates) are plain dicts of
+{key: (expiry, value)}. These helpers read and fill them so the expiry and
+size-cap rules live in one place. Expiries use time.monotonic() unless the
+caller passes its own clock reading as `now`.
+"""
+
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+TTLCache = Dict[Hashable, Tuple[float, Any]]
+
+
+def get_cached(cache: TTLCache, key: Hashable, default: Any = None, now: Optional[float] = None) -> Any:
+    """Return the cached value for key, or default if it is missing or expired"""
+    cached = cache.get(key)
+    if cached is None:
+        return default
+    if cached[0] > (time.monotonic() if now is None else now):
+        return cached[1]
+    del cache[key]
+    return default
+
+
+def remember(cache: TTLCache, key: Hashable, value: Any, ttl: float, max_size: int, now: Optional[float] = None):
+    """
+    Cache value for ttl seconds.
+
+    When the cache is full, expired entries are evicted first; if it is still
+    full, it is cleared rather than growing without bound.
+    """
+    if now is None:
+        now = time.monotonic()
+    if len(cache) >= max_size:
+        for stale in [k for k, (expiry, _) in cache.items() if expiry <= now]:
+            del cache[stale]
+        if len(cache) >= max_size:
+            cache.clear()
+    cache[key] = (now + ttl, value)
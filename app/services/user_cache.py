@@ -0,0 +1,77 @@
+"""
+Cognito sub -> MongoDB user resolution and profile caching
+
+Every authenticated event handler starts by mapping the token's Cognito sub
+to the user's MongoDB _id (and display name). The mapping never changes for
+a given sub, so it is cached in-process instead of costing a find_one per
+request. Profile reads (GET /users/{id}, /users/me) are cached for a shorter
+time and dropped whenever the user's stats change.
+"""
+
+from typing import Dict, Optional, Tuple
+
+from bson import ObjectId
+
+from app.database import get_database
+from app.services.ttl_cache import get_cached, remember
+
+# {cognito_sub: (expiry, {"_id": ObjectId, "name": str})}
+_user_cache: Dict[str, Tuple[float, dict]] = {}
+USER_CACHE_TTL = 300  # seconds
+USER_CACHE_MAX_SIZE = 50000
+
+# {user_id: (expiry, profile document)}
+_profile_cache: Dict[str, Tuple[float, dict]] = {}
+PROFILE_CACHE_TTL = 60  # seconds
+PROFILE_CACHE_MAX_SIZE = 50000
+
+# Fields returned by the profile endpoints
+PROFILE_PROJECTION = {"phone": 1, "name": 1, "stats": 1, "created_at": 1}
+
+
+async def resolve_user(cognito_sub: str, db=None) -> Optional[dict]:
+    """
+    Get the MongoDB user ({_id, name}) for a Cognito sub, or None.
+
+    Misses are not cached, so a profile created right after a failed
+    lookup is found on the next request.
+    """
+    user = get_cached(_user_cache, cognito_sub)
+    if user is not None:
+        return user
+
+    if db is None:
+        db = await get_database()
+
+    user = await db.users.find_one({"cognito_sub": cognito_sub}, {"_id": 1, "name": 1})
+    if user is not None:
+        remember(_user_cache, cognito_sub, user, USER_CACHE_TTL, USER_CACHE_MAX_SIZE)
+
+    return user
+
+
+def invalidate_user(cognito_sub: str):
+    """Drop a cached mapping after the user's profile changes"""
+    _user_cache.pop(cognito_sub, None)
+
+
+async def get_user_profile(user_oid: ObjectId, db=None) -> Optional[dict]:
+    """Get a user's profile fields (PROFILE_PROJECTION) by _id, or None"""
+    user_id = str(user_oid)
+    profile = get_cached(_profile_cache, user_id)
+    if profile is not None:
+        return profile
+
+    if db is None:
+        db = await get_database()
+
+    profile = await db.users.find_one({"_id": user_oid}, PROFILE_PROJECTION)
+    if profile is not None:
+        remember(_profile_cache, user_id, profile, PROFILE_CACHE_TTL, PROFILE_CACHE_MAX_SIZE)
+
+    return profile
+
+
+def invalidate_user_profile(user_id: str):
+    """Drop a cached profile after the user's stats or profile change"""
+    _profile_cache.pop(str(user_id), None)
@@ -1,15 +1,24 @@
 from fastapi import WebSocket
 from typing import Dict, List, Set, Optional, Tuple
-import json
 import logging
 import asyncio
+import time
+import orjson
 from datetime import datetime
 from dataclasses import dataclass, field
 
+from app.config import settings
+from app.websockets.spatial import EventSpatialIndex, PointGridIndex
+
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+def encode_message(message: dict) -> str:
+    """Serialize a message to JSON text with orjson (datetimes/ObjectIds handled)"""
+    return orjson.dumps(message, default=str).decode()
+
+
+@dataclass(slots=True, frozen=True)
 class UserLocation:
     """User location with metadata for integrity"""
     user_id: str
@@ -18,6 +27,8 @@ class UserLocation:
     accuracy: Optional[float] = None
     speed: Optional[float] = None
     heading: Optional[float] = None
+    # time.monotonic_ns() when recorded; orders updates regardless of wall-clock steps
+    received_ns: int = 0
 
 
 class ConnectionManager:
@@ -29,33 +40,70 @@ class ConnectionManager:
     - Broadcast to all connected users
     - Broadcast to users in specific events
     - Track user locations and active connections
-    - Thread-safe operations with asyncio.Lock to prevent race conditions
+    - asyncio.Lock around membership changes; reads and snapshots run lock-free
+      (the manager lives on one event loop, and nothing awaits mid-read)
     - Data integrity for location updates
     """
 
-    def __init__(self):
+    def __init__(self, location_min_interval: float = 1.0, max_concurrent_sends: int = 256, outbox_size: int = 1000):
         # Store active connections: {user_id: WebSocket}
         self.active_connections: Dict[str, WebSocket] = {}
 
+        # Outbound messages per connection, each drained by its own writer task
+        # {user_id: asyncio.Queue of serialized payloads}
+        self._outbox_size = outbox_size
+        self._outboxes: Dict[str, asyncio.Queue] = {}
+        # {user_id: writer asyncio.Task}
+        self._writers: Dict[str, asyncio.Task] = {}
+
         # Store event participants: {event_id: Set[user_id]}
         self.event_participants: Dict[str, Set[str]] = {}
+        # Reverse of event_participants: {user_id: Set[event_id]}
+        self.user_events: Dict[str, Set[str]] = {}
 
         # Store user locations with metadata: {user_id: UserLocation}
         self.user_locations: Dict[str, UserLocation] = {}
+        # Grid over user_locations for radius queries
+        self.user_index = PointGridIndex()
+
+        # In-memory mirror of active events for nearby lookups
+        self.event_index = EventSpatialIndex()
         
         # Locks for thread-safe operations (prevent race conditions)
         self._connection_lock = asyncio.Lock()
         self._location_lock = asyncio.Lock()
         self._event_lock = asyncio.Lock()
         
+        # Caps in-flight socket writes across all writer tasks
+        self._send_semaphore = asyncio.Semaphore(max_concurrent_sends)
+
         # Location update queue for consistency
         self._location_queue: asyncio.Queue = asyncio.Queue()
 
+        # Per-user location throttle: {user_id: monotonic time of last processed update}
+        self._location_min_interval = location_min_interval
+        self._last_location_processed: Dict[str, float] = {}
+        # Latest throttled update per user, processed by flush: {user_id: message}
+        self._pending_location_updates: Dict[str, dict] = {}
+
+        # Location updates waiting for the next batched positions frame: {user_id: update}
+        self._pending_positions: Dict[str, dict] = {}
+
     async def connect(self, websocket: WebSocket, user_id: str):
-        """Accept WebSocket connection and store it with race condition protection"""
+        """Accept WebSocket connection, store it and start its writer task"""
+        # Handshake outside the lock so one slow client doesn't hold up other connects
+        await websocket.accept()
+
         async with self._connection_lock:
-            await websocket.accept()
+            # A reconnect replaces the old socket; stop writing to it
+            previous_writer = self._writers.pop(user_id, None)
+            if previous_writer is not None:
+                previous_writer.cancel()
+
+            outbox: asyncio.Queue = asyncio.Queue(maxsize=self._outbox_size)
             self.active_connections[user_id] = websocket
+            self._outboxes[user_id] = outbox
+            self._writers[user_id] = asyncio.create_task(self._write_loop(user_id, websocket, outbox))
             logger.info(f"✅ User {user_id} connected. Total connections: {len(self.active_connections)}")
 
     async def disconnect(self, user_id: str):
@@ -65,31 +113,84 @@ class ConnectionManager:
                 del self.active_connections[user_id]
                 logger.info(f"❌ User {user_id} disconnected. Total connections: {len(self.active_connections)}")
 
-        # Remove from all events
-        async with self._event_lock:
-            for event_id in list(self.event_participants.keys()):
-                if user_id in self.event_participants[event_id]:
-                    self.event_participants[event_id].remove(user_id)
+            self._outboxes.pop(user_id, None)
+            writer = self._writers.pop(user_id, None)
+            if writer is not None and writer is not asyncio.current_task():
+                writer.cancel()
 
-                    # Clean up empty event sets
-                    if len(self.event_participants[event_id]) == 0:
-                        del self.event_participants[event_id]
+        # Remove from the user's events
+        async with self._event_lock:
+            for event_id in self.user_events.pop(user_id, ()):
+                self._discard_participant(event_id, user_id)
 
         # Remove location
         async with self._location_lock:
             if user_id in self.user_locations:
                 del self.user_locations[user_id]
+            self.user_index.remove(user_id)
+
+        self._last_location_processed.pop(user_id, None)
+        self._pending_location_updates.pop(user_id, None)
+        self._pending_positions.pop(user_id, None)
+
+    async def _write_loop(self, user_id: str, websocket: WebSocket, outbox: asyncio.Queue):
+        """Send a connection's queued payloads in order; the only task writing to that socket"""
+        try:
+            while True:
+                payload = await outbox.get()
+                async with self._send_semaphore:
+                    await websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending to {user_id}: {e}")
+            # Leave a newer connection for the same user alone
+            if self.active_connections.get(user_id) is websocket:
+                await self.disconnect(user_id)
+
+    def _enqueue_all(self, user_ids: List[str], payload: str, droppable: bool = False) -> List[str]:
+        """
+        Queue a serialized payload for each user's writer task
 
-    async def send_personal_message(self, user_id: str, message: dict):
-        """Send message to a specific user with connection protection"""
-        async with self._connection_lock:
-            if user_id in self.active_connections:
+        Never awaits, so a broadcast costs one put_nowait per recipient and a
+        slow client cannot hold up anyone else.
+
+        Args:
+            user_ids: Recipients (users without a connection are skipped)
+            payload: Serialized message
+            droppable: Skip full queues instead of reporting them (telemetry frames)
+
+        Returns:
+            user_ids whose queue was full
+        """
+        slow_users = []
+        for user_id in user_ids:
+            outbox = self._outboxes.get(user_id)
+            if outbox is None:
+                continue
+            try:
+                outbox.put_nowait(payload)
+            except asyncio.QueueFull:
+                if not droppable:
+                    slow_users.append(user_id)
+        return slow_users
+
+    async def _drop_slow_clients(self, user_ids: List[str]):
+        """Disconnect clients that stopped draining their outbound queue"""
+        for user_id in user_ids:
+            websocket = self.active_connections.get(user_id)
+            logger.warning(f"Outbound queue full for {user_id}, disconnecting slow client")
+            await self.disconnect(user_id)
+            if websocket is not None:
                 try:
-                    await self.active_connections[user_id].send_json(message)
-                except Exception as e:
-                    logger.error(f"Error sending message to {user_id}: {e}")
-                    # Don't disconnect here - let the main handler deal with it
-                    raise
+                    await websocket.close(code=1013)
+                except Exception:
+                    pass
+
+    async def send_personal_message(self, user_id: str, message: dict):
+        """Queue a message for a specific user"""
+        if user_id in self._outboxes:
+            await self._drop_slow_clients(self._enqueue_all([user_id], encode_message(message)))
 
     async def broadcast(self, message: dict, exclude: List[str] = None):
         """
@@ -99,25 +200,11 @@ class ConnectionManager:
             message: Message to broadcast
             exclude: List of user_ids to exclude from broadcast
         """
-        exclude = exclude or []
-        disconnected_users = []
+        exclude = set(exclude or ())
+        payload = encode_message(message)
 
-        async with self._connection_lock:
-            # Create a snapshot of connections to avoid modification during iteration
-            connections_snapshot = list(self.active_connections.items())
-        
-        # Send messages outside the lock to avoid blocking other operations
-        for user_id, connection in connections_snapshot:
-            if user_id not in exclude:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error broadcasting to {user_id}: {e}")
-                    disconnected_users.append(user_id)
-
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            await self.disconnect(user_id)
+        recipients = [user_id for user_id in self._outboxes if user_id not in exclude]
+        await self._drop_slow_clients(self._enqueue_all(recipients, payload))
 
     async def broadcast_to_event(self, event_id: str, message: dict):
         """
@@ -127,37 +214,39 @@ class ConnectionManager:
             event_id: Event identifier
             message: Message to broadcast
         """
-        async with self._event_lock:
-            if event_id not in self.event_participants:
-                return
-            # Create a snapshot to avoid modification during iteration
-            participants = list(self.event_participants[event_id])
+        # Snapshot: the set may change while slow clients are being dropped
+        participants = list(self.event_participants.get(event_id, ()))
+        if not participants:
+            return
 
-        for user_id in participants:
-            try:
-                await self.send_personal_message(user_id, message)
-            except Exception as e:
-                logger.error(f"Error sending to {user_id} in event {event_id}: {e}")
+        await self._drop_slow_clients(self._enqueue_all(participants, encode_message(message)))
+
+    def _discard_participant(self, event_id: str, user_id: str):
+        """Remove a user from an event's participant set, dropping the set once empty"""
+        participants = self.event_participants.get(event_id)
+        if participants is not None:
+            participants.discard(user_id)
+            if not participants:
+                del self.event_participants[event_id]
 
     async def join_event(self, user_id: str, event_id: str):
         """Add user to event participants with race condition protection"""
         async with self._event_lock:
-            if event_id not in self.event_participants:
-                self.event_participants[event_id] = set()
-
-            self.event_participants[event_id].add(user_id)
+            self.event_participants.setdefault(event_id, set()).add(user_id)
+            self.user_events.setdefault(user_id, set()).add(event_id)
             logger.info(f"User {user_id} joined event {event_id}")
 
     async def leave_event(self, user_id: str, event_id: str):
         """Remove user from event participants with race condition protection"""
         async with self._event_lock:
-            if event_id in self.event_participants:
-                self.event_participants[event_id].discard(user_id)
-
-                # Clean up empty event sets
-                if len(self.event_participants[event_id]) == 0:
-                    del self.event_participants[event_id]
+            user_events = self.user_events.get(user_id)
+            if user_events is not None:
+                user_events.discard(event_id)
+                if not user_events:
+                    del self.user_events[user_id]
 
+            if event_id in self.event_participants:
+                self._discard_participant(event_id, user_id)
                 logger.info(f"User {user_id} left event {event_id}")
 
     async def update_user_location(
@@ -166,7 +255,8 @@ class ConnectionManager:
         coordinates: Tuple[float, float],
         accuracy: Optional[float] = None,
         speed: Optional[float] = None,
-        heading: Optional[float] = None
+        heading: Optional[float] = None,
+        timestamp: Optional[datetime] = None
     ) -> UserLocation:
         """
         Update user's location with full data integrity and race condition protection
@@ -177,6 +267,7 @@ class ConnectionManager:
             accuracy: GPS accuracy in meters
             speed: Speed in m/s
             heading: Heading in degrees (0-360)
+            timestamp: Wall-clock time to report (defaults to now)
             
         Returns:
             UserLocation object with updated data
@@ -185,114 +276,169 @@ class ConnectionManager:
             location = UserLocation(
                 user_id=user_id,
                 coordinates=coordinates,
-                timestamp=datetime.now(),
+                timestamp=timestamp or datetime.now(),
                 accuracy=accuracy,
                 speed=speed,
-                heading=heading
+                heading=heading,
+                received_ns=time.monotonic_ns()
             )
             
             # Only update if this is newer than existing location
             if user_id in self.user_locations:
                 old_location = self.user_locations[user_id]
-                if old_location.timestamp > location.timestamp:
+                if old_location.received_ns > location.received_ns:
                     logger.warning(f"Rejecting old location update for {user_id}")
                     return old_location
             
             self.user_locations[user_id] = location
+            self.user_index.upsert(user_id, coordinates[0], coordinates[1])
             logger.debug(f"Updated location for {user_id}: {coordinates}")
             return location
     
+    def throttle_location_update(self, user_id: str, data: dict) -> bool:
+        """
+        Decide whether a location update should be processed now
+
+        Updates arriving within the minimum interval are kept as the user's
+        pending update (replacing any older one) and picked up later by
+        pop_due_location_updates. No await, so the check-and-set is atomic.
+
+        Returns:
+            True if the update should be processed immediately
+        """
+        now = time.monotonic()
+        last = self._last_location_processed.get(user_id)
+
+        if last is not None and now - last < self._location_min_interval:
+            self._pending_location_updates[user_id] = data
+            return False
+
+        self._last_location_processed[user_id] = now
+        self._pending_location_updates.pop(user_id, None)
+        return True
+
+    def pop_due_location_updates(self) -> List[Tuple[str, dict]]:
+        """Take the pending location updates whose throttle interval has elapsed"""
+        now = time.monotonic()
+        due = []
+
+        for user_id, data in list(self._pending_location_updates.items()):
+            if now - self._last_location_processed.get(user_id, 0) >= self._location_min_interval:
+                self._last_location_processed[user_id] = now
+                del self._pending_location_updates[user_id]
+                due.append((user_id, data))
+
+        return due
+
     async def get_user_location(self, user_id: str) -> Optional[UserLocation]:
-        """Get user's current location with race condition protection"""
-        async with self._location_lock:
-            return self.user_locations.get(user_id)
+        """Get user's current location"""
+        return self.user_locations.get(user_id)
     
     async def get_all_locations(self) -> Dict[str, UserLocation]:
-        """Get all user locations with race condition protection"""
-        async with self._location_lock:
-            return dict(self.user_locations)
+        """Get a snapshot of all user locations"""
+        return dict(self.user_locations)
 
     async def get_event_participants(self, event_id: str) -> List[str]:
-        """Get list of user IDs in an event with race condition protection"""
-        async with self._event_lock:
-            return list(self.event_participants.get(event_id, set()))
+        """Get list of user IDs in an event"""
+        return list(self.event_participants.get(event_id, ()))
 
-    async def get_nearby_users(self, coordinates: Tuple[float, float], radius_km: float = 5.0) -> List[dict]:
+    async def get_nearby_users(
+        self,
+        coordinates: Tuple[float, float],
+        radius_km: float = 5.0,
+        exclude_user_id: Optional[str] = None
+    ) -> List[dict]:
         """
-        Get users within a certain radius with race condition protection
+        Get users within a certain radius
 
         Args:
             coordinates: (lng, lat)
             radius_km: Radius in kilometers
+            exclude_user_id: User to leave out of the results (the requester)
 
         Returns:
             List of {user_id, coordinates, distance, timestamp}
         """
-        from geopy.distance import geodesic
-
         nearby_users = []
-        user_point = (coordinates[1], coordinates[0])  # (lat, lng) for geodesic
 
-        async with self._location_lock:
-            # Create snapshot to avoid holding lock during calculations
-            locations_snapshot = dict(self.user_locations)
-        
-        for user_id, user_location in locations_snapshot.items():
-            other_point = (user_location.coordinates[1], user_location.coordinates[0])
-            distance = geodesic(user_point, other_point).kilometers
-
-            if distance <= radius_km:
-                nearby_users.append({
-                    "user_id": user_id,
-                    "coordinates": list(user_location.coordinates),
-                    "distance": round(distance, 2),
-                    "timestamp": user_location.timestamp.isoformat(),
-                    "accuracy": user_location.accuracy,
-                    "speed": user_location.speed,
-                    "heading": user_location.heading
-                })
-
-        # Sort by distance
-        nearby_users.sort(key=lambda x: x["distance"])
+        # Only the grid cells around the query are scanned; matches come back closest first
+        for distance, user_id in self.user_index.within(coordinates, radius_km):
+            if user_id == exclude_user_id:
+                continue
+
+            user_location = self.user_locations[user_id]
+            nearby_users.append({
+                "user_id": user_id,
+                "coordinates": user_location.coordinates,
+                "distance": round(distance, 2),
+                "timestamp": user_location.timestamp,
+                "accuracy": user_location.accuracy,
+                "speed": user_location.speed,
+                "heading": user_location.heading
+            })
+
         return nearby_users
 
+    def events_near(self, coordinates: Tuple[float, float], max_distance_m: float, limit: int = 20) -> List[dict]:
+        """Get active events near coordinates (lng, lat) from the in-memory index"""
+        return self.event_index.near(coordinates, max_distance_m, limit=limit)
+
     async def get_stats(self) -> dict:
-        """Get connection statistics with race condition protection"""
-        async with self._connection_lock:
-            total_connections = len(self.active_connections)
-        
-        async with self._event_lock:
-            active_events = len(self.event_participants)
-            total_participants = sum(len(participants) for participants in self.event_participants.values())
-        
-        async with self._location_lock:
-            users_with_location = len(self.user_locations)
-        
+        """Get connection statistics"""
         return {
-            "total_connections": total_connections,
-            "active_events": active_events,
-            "total_participants": total_participants,
-            "users_with_location": users_with_location
+            "total_connections": len(self.active_connections),
+            "active_events": len(self.event_participants),
+            "total_participants": sum(len(participants) for participants in self.event_participants.values()),
+            "users_with_location": len(self.user_locations),
+            "indexed_events": len(self.event_index)
         }
     
-    async def broadcast_location_update(self, user_id: str, location: UserLocation, exclude_user: bool = True):
+    async def broadcast_location_update(self, user_id: str, location: UserLocation):
         """
-        Broadcast a user's location update to all connected users
-        
+        Queue a user's location update for the next batched positions frame
+
+        Only the latest update per user is kept; flush_positions sends them all
+        to every connected user in a single frame.
+
         Args:
             user_id: User whose location was updated
             location: UserLocation object
-            exclude_user: Whether to exclude the user from the broadcast
         """
-        message = {
-            "type": "location_update",
+        self._pending_positions[user_id] = {
             "user_id": user_id,
-            "coordinates": list(location.coordinates),
-            "timestamp": location.timestamp.isoformat(),
+            "coordinates": location.coordinates,
+            "timestamp": location.timestamp,
             "accuracy": location.accuracy,
             "speed": location.speed,
             "heading": location.heading
         }
-        
-        exclude_list = [user_id] if exclude_user else []
-        await self.broadcast(message, exclude=exclude_list)
+
+    async def flush_positions(self):
+        """
+        Broadcast all queued location updates as one positions frame, serialized once
+
+        Every client gets the same frame, including the entries for its own
+        moves; clients skip their own user_id.
+        """
+        if not self._pending_positions:
+            return
+
+        updates = list(self._pending_positions.values())
+        self._pending_positions = {}
+
+        payload = encode_message({
+            "type": "positions",
+            "updates": updates,
+            "timestamp": datetime.now()
+        })
+
+        # A client that is behind skips this frame rather than being dropped
+        self._enqueue_all(list(self._outboxes), payload, droppable=True)
+
+
+# Global connection manager instance (shared by the WebSocket endpoint and HTTP routes)
+manager = ConnectionManager(
+    location_min_interval=settings.LOCATION_UPDATE_MIN_INTERVAL,
+    max_concurrent_sends=settings.WS_MAX_CONCURRENT_SENDS,
+    outbox_size=settings.WS_OUTBOX_SIZE
+)
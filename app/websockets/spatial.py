@@ -0,0 +1,220 @@
+# Geospatial helpers for in-memory proximity queries
+import math
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lng1: float, lat1: float, lng2: float, lat2: float) -> float:
+    """Great-circle distance in kilometers between two (lng, lat) points"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _haversine_km_from(phi1: float, cos_phi1: float, lambda1: float, lng2: float, lat2: float) -> float:
+    """haversine_km with the query point already in radians, for loops over many candidates"""
+    phi2 = math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + cos_phi1 * math.cos(phi2) * math.sin((math.radians(lng2) - lambda1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _search_box(lat: float, radius_km: float) -> Tuple[float, float]:
+    """Half-width (d_lng, d_lat) in degrees of the box around a search circle"""
+    angle = radius_km / EARTH_RADIUS_KM
+    d_lat = math.degrees(angle)
+
+    # Widest longitude offset on the circle; near the poles it spans every longitude
+    sin_angle = math.sin(angle)
+    cos_lat = math.cos(math.radians(lat))
+    if angle >= math.pi / 2 or sin_angle >= cos_lat:
+        return 180.0, d_lat
+    return math.degrees(math.asin(sin_angle / cos_lat)), d_lat
+
+
+def _box_cells(lng: float, lat: float, d_lng: float, d_lat: float, cell_size_deg: float) -> Iterator[Tuple[int, int]]:
+    """Grid cells covering a search box, wrapping across the antimeridian"""
+    def cell(value: float) -> int:
+        return math.floor(value / cell_size_deg)
+
+    west, east = lng - d_lng, lng + d_lng
+    x_ranges = [(cell(max(west, -180.0)), cell(min(east, 180.0)))]
+    if west < -180:
+        x_ranges.append((cell(west + 360), cell(180.0)))
+    if east > 180:
+        x_ranges.append((cell(-180.0), cell(east - 360)))
+
+    min_y, max_y = cell(lat - d_lat), cell(lat + d_lat)
+    for min_x, max_x in x_ranges:
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                yield (x, y)
+
+
+def _outside_box(lng: float, lat: float, point_lng: float, point_lat: float, d_lng: float, d_lat: float) -> bool:
+    """Cheap reject before the haversine for points in edge cells"""
+    if abs(point_lat - lat) > d_lat:
+        return True
+    d = abs(point_lng - lng)
+    return min(d, 360 - d) > d_lng
+
+
+class PointGridIndex:
+    """
+    Grid index of (lng, lat) points keyed by id, for radius queries that only
+    scan the cells around the query instead of every point
+    """
+
+    def __init__(self, cell_size_deg: float = 0.05):
+        self.cell_size_deg = cell_size_deg
+        # {key: (lng, lat)}
+        self._points: Dict[str, Tuple[float, float]] = {}
+        # {key: cell}
+        self._point_cells: Dict[str, Tuple[int, int]] = {}
+        # {cell: Set[key]}
+        self._cells: Dict[Tuple[int, int], Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, lng: float, lat: float) -> Tuple[int, int]:
+        return (math.floor(lng / self.cell_size_deg), math.floor(lat / self.cell_size_deg))
+
+    def upsert(self, key: str, lng: float, lat: float):
+        """Add or move a point"""
+        cell = self._cell(lng, lat)
+        old_cell = self._point_cells.get(key)
+
+        # Most moves stay inside the same cell
+        if old_cell != cell:
+            if old_cell is not None:
+                self._discard(key, old_cell)
+            self._cells.setdefault(cell, set()).add(key)
+            self._point_cells[key] = cell
+
+        self._points[key] = (lng, lat)
+
+    def clear(self):
+        """Remove every point"""
+        self._points.clear()
+        self._point_cells.clear()
+        self._cells.clear()
+
+    def remove(self, key: str):
+        """Remove a point if present"""
+        self._points.pop(key, None)
+        cell = self._point_cells.pop(key, None)
+        if cell is not None:
+            self._discard(key, cell)
+
+    def _discard(self, key: str, cell: Tuple[int, int]):
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._cells[cell]
+
+    def within(self, coordinates: Tuple[float, float], radius_km: float) -> List[Tuple[float, str]]:
+        """
+        Get (distance_km, key) for points within radius_km of coordinates, closest first
+
+        Args:
+            coordinates: (lng, lat)
+            radius_km: Search radius in kilometers
+        """
+        lng, lat = coordinates
+
+        d_lng, d_lat = _search_box(lat, radius_km)
+
+        phi1 = math.radians(lat)
+        cos_phi1 = math.cos(phi1)
+        lambda1 = math.radians(lng)
+
+        matches = []
+        for cell in _box_cells(lng, lat, d_lng, d_lat, self.cell_size_deg):
+            for key in self._cells.get(cell, ()):
+                point_lng, point_lat = self._points[key]
+                if _outside_box(lng, lat, point_lng, point_lat, d_lng, d_lat):
+                    continue
+                distance = _haversine_km_from(phi1, cos_phi1, lambda1, point_lng, point_lat)
+                if distance <= radius_km:
+                    matches.append((distance, key))
+
+        matches.sort()
+        return matches
+
+
+class EventSpatialIndex:
+    """
+    Grid index of active events for nearby lookups without a database round-trip
+
+    Event locations live in a PointGridIndex; a radius query only scans the
+    cells overlapping the query's bounding box and then filters by haversine
+    distance. Results are sorted by distance, like MongoDB's $near.
+    """
+
+    def __init__(self, cell_size_deg: float = 0.05):
+        # 0.05 degrees is roughly 5.5km at the equator
+        self._grid = PointGridIndex(cell_size_deg)
+        # {event_id: event document with string ids}
+        self._events: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def upsert(self, event: dict):
+        """Add or replace an event (expects a MongoDB event document)"""
+        coordinates = (event.get("location") or {}).get("coordinates")
+        if not coordinates or len(coordinates) != 2:
+            return
+
+        event_id = str(event["_id"])
+        event = {**event, "_id": event_id}
+        if event.get("creator_id") is not None:
+            event["creator_id"] = str(event["creator_id"])
+
+        self._events[event_id] = event
+        self._grid.upsert(event_id, coordinates[0], coordinates[1])
+
+    def remove(self, event_id: str):
+        """Remove an event if present"""
+        event_id = str(event_id)
+        self._events.pop(event_id, None)
+        self._grid.remove(event_id)
+
+    def replace_all(self, events: List[dict]):
+        """Rebuild the index from a full list of active events"""
+        self._events.clear()
+        self._grid.clear()
+        for event in events:
+            self.upsert(event)
+
+    def apply_change(self, change: dict):
+        """Apply a MongoDB change stream event (opened with full_document='updateLookup')"""
+        operation = change.get("operationType")
+        document_key = (change.get("documentKey") or {}).get("_id")
+
+        if operation in ("insert", "update", "replace"):
+            document: Optional[dict] = change.get("fullDocument")
+            if document and document.get("status") == "active":
+                self.upsert(document)
+            elif document_key is not None:
+                self.remove(document_key)
+        elif operation == "delete" and document_key is not None:
+            self.remove(document_key)
+
+    def near(self, coordinates: Tuple[float, float], max_distance_m: float, limit: int = 20) -> List[dict]:
+        """
+        Get events within max_distance_m of coordinates, closest first
+
+        Args:
+            coordinates: (lng, lat)
+            max_distance_m: Search radius in meters
+            limit: Maximum number of events to return
+        """
+        matches = self._grid.within(coordinates, max_distance_m / 1000)
+        return [self._events[event_id] for _, event_id in matches[:limit]]
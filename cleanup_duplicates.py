@@ -3,7 +3,7 @@ Cleanup script to remove duplicate participants from events
 Run this once to fix existing database issues
 """
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient, UpdateOne
 from datetime import datetime
 import os
 from dotenv import load_dotenv
@@ -11,20 +11,23 @@ from dotenv import load_dotenv
 load_dotenv()
 
 MONGODB_URL = os.getenv("MONGODB_URL")
+BATCH_SIZE = 1000
 
 async def cleanup_duplicate_participants():
     """Remove duplicate participants from all events"""
-    client = AsyncIOMotorClient(MONGODB_URL)
+    client = AsyncMongoClient(MONGODB_URL)
     db = client.citypulse_live
 
     print("Finding events with duplicate participants...")
 
-    # Get all events
-    events = await db.events.find({}).to_list(1000)
+    # Stream events that have at least two participants, fetching only the participants
+    events = db.events.find({"participants.1": {"$exists": True}}, {"participants": 1})
 
     fixed_count = 0
+    now = datetime.utcnow()
+    ops = []
 
-    for event in events:
+    async for event in events:
         event_id = event["_id"]
         participants = event.get("participants", [])
 
@@ -51,22 +54,29 @@ async def cleanup_duplicate_participants():
             print(f"   - Unique participants: {len(unique_participants)}")
             print(f"   - Duplicates removed: {duplicates_removed}")
 
-            # Update the event
-            await db.events.update_one(
+            # Queue the update; written in batches below
+            ops.append(UpdateOne(
                 {"_id": event_id},
                 {
                     "$set": {
                         "participants": unique_participants,
                         "room.current_participants": len(unique_participants),
-                        "updated_at": datetime.utcnow()
+                        "updated_at": now
                     }
                 }
-            )
+            ))
             fixed_count += 1
 
+            if len(ops) >= BATCH_SIZE:
+                await db.events.bulk_write(ops, ordered=False)
+                ops = []
+
+    if ops:
+        await db.events.bulk_write(ops, ordered=False)
+
     print(f"\nCleanup complete! Fixed {fixed_count} events")
 
-    client.close()
+    await client.close()
 
 if __name__ == "__main__":
     asyncio.run(cleanup_duplicate_participants())
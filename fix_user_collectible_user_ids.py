@@ -0,0 +1,34 @@
+"""
+Script to fix user_id in user_collectibles collection
+Converts string user_id to ObjectId (smaller index entries than hex strings)
+"""
+import asyncio
+from pymongo import AsyncMongoClient
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+MONGODB_URL = os.getenv("MONGODB_URL")
+
+async def fix_user_ids():
+    """Convert string user_id to ObjectId in user_collectibles"""
+    client = AsyncMongoClient(MONGODB_URL)
+    db = client.citypulse_live
+
+    print("Converting user_collectibles with string user_id...")
+
+    # Convert server-side in one update; skip anything that isn't a valid hex id
+    result = await db.user_collectibles.update_many(
+        {"user_id": {"$type": "string", "$regex": "^[0-9a-fA-F]{24}$"}},
+        [{"$set": {"user_id": {"$toObjectId": "$user_id"}}}]
+    )
+    print(f"[DONE] Fixed {result.modified_count} documents")
+
+    remaining = await db.user_collectibles.count_documents({"user_id": {"$type": "string"}})
+    if remaining:
+        print(f"[WARN] {remaining} documents still have a non-ObjectId user_id")
+
+    await client.close()
+
+if __name__ == "__main__":
+    asyncio.run(fix_user_ids())
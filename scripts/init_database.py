@@ -6,6 +6,7 @@ Run this once after setting up your MongoDB connection.
 
 Usage:
     python scripts/init_database.py
+    python scripts/init_database.py --shard-collectibles   # sharded clusters on MongoDB 7.1+ only
 """
 
 import asyncio
@@ -15,6 +16,7 @@ from pathlib import Path
 # Add parent directory to path to import app modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from app import database
 from app.database import init_database, get_database, close_database
 from app.config import settings
 import logging
@@ -23,7 +25,56 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def main():
+async def shard_collectibles():
+    """
+    Shard collectibles on a hashed event_id
+
+    ObjectId _ids grow monotonically, so with the default key every new drop
+    lands on the same chunk. Hashing event_id spreads concurrent drops from
+    different events across shards. Must run against a mongos before the
+    collection holds data; the empty collection is pre-split automatically.
+
+    Requires MongoDB 7.1+: claim_collectible runs findAndModify filtered on
+    _id alone, and older versions reject that on a sharded collection unless
+    the filter includes the shard key.
+    """
+    admin = database.client.admin
+    namespace = f"{settings.DATABASE_NAME}.collectibles"
+
+    build_info = await admin.command("buildInfo")
+    version = tuple(build_info["versionArray"][:2])
+    if version < (7, 1):
+        raise RuntimeError(
+            f"Refusing to shard {namespace} on MongoDB {build_info['version']}: "
+            "collectible claims filter on _id only and need MongoDB 7.1+ on a sharded collection"
+        )
+
+    # No-op on MongoDB 6.0+, required before sharding on older servers
+    await admin.command("enableSharding", settings.DATABASE_NAME)
+    await admin.command("shardCollection", namespace, key={"event_id": "hashed"})
+    logger.info(f"🧩 Sharded {namespace} on hashed event_id")
+
+
+async def verify_nearby_plan(db):
+    """Explain the /events/nearby aggregation and log whether it walks the 2dsphere index"""
+    from app.routes.events import nearby_pipeline
+
+    pipeline = nearby_pipeline(-74.0817, 4.6097, 5000, status="active")
+    explain = await db.command(
+        "explain",
+        {"aggregate": "events", "pipeline": pipeline, "cursor": {}},
+        verbosity="queryPlanner"
+    )
+
+    # Depending on the server version the plan sits at the top level or under
+    # the first stage's $cursor, so search the whole explain output
+    if "GEO_NEAR_2DSPHERE" in str(explain):
+        logger.info("📍 /events/nearby uses GEO_NEAR_2DSPHERE")
+    else:
+        logger.warning(f"⚠️ /events/nearby is not using the 2dsphere index: {explain}")
+
+
+async def main(shard: bool = False):
     """Initialize database with collections and indexes"""
     try:
         logger.info(f"🔧 Connecting to MongoDB: {settings.DATABASE_NAME}")
@@ -33,14 +84,20 @@ async def main():
 
         db = await get_database()
 
+        if shard:
+            await shard_collectibles()
+
+        await verify_nearby_plan(db)
+
         # List all collections
         collections = await db.list_collection_names()
         logger.info(f"📦 Available collections: {collections}")
 
         # Show indexes for each collection
-        for collection_name in ["users", "events", "collectibles", "user_collectibles", "transcriptions"]:
+        for collection_name in ["users", "events", "collectibles", "user_collectibles", "transcriptions", "transcription_segments"]:
             if collection_name in collections:
-                indexes = await db[collection_name].list_indexes().to_list(None)
+                cursor = await db[collection_name].list_indexes()
+                indexes = await cursor.to_list(None)
                 logger.info(f"\n📋 Indexes for {collection_name}:")
                 for idx in indexes:
                     logger.info(f"  - {idx['name']}: {idx.get('key', {})}")
@@ -58,4 +115,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(shard="--shard-collectibles" in sys.argv[1:]))
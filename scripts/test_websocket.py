@@ -60,9 +60,8 @@ async def simulate_user(user_id: str, location_data: dict):
                     data = json.loads(response)
                     print(f"📨 [{user_id}] Respuesta: {data['type']}")
                     
-                    if data['type'] == 'nearby_users':
+                    if data['type'] == 'proximity':
                         print(f"   👥 Usuarios cercanos: {len(data.get('users', []))}")
-                    elif data['type'] == 'nearby_events':
                         print(f"   📍 Eventos cercanos: {len(data.get('events', []))}")
                     
                 except asyncio.TimeoutError: